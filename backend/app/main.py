@@ -1,18 +1,53 @@
 """
 Main FastAPI application entry point
 """
-from fastapi import FastAPI
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.routers import rooms, autocomplete, websocket
-from app.database import engine, Base
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.routers import admin, rooms, autocomplete, websocket
+from app.database import engine, init_db
+from app.services.collaboration import hub
+from app.services.document_store import document_store
+from app.services.metrics import metrics
+from app.services.profiler import RequestProfilingMiddleware, profiler
+from app.services.presence import cursor_coalescer, presence_batcher
+from app.services.provider_executor import provider_executor
+from app.services.room_lifecycle import room_lifecycle
+from app.services.spectators import spectator_fanout
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Seconds the health check waits for the database
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run background services for the lifetime of the application"""
+    # Create database tables
+    await init_db()
+    await hub.start()
+    document_store.start()
+    room_lifecycle.start()
+    yield
+    await room_lifecycle.stop()
+    # Write out a capture still in progress
+    profiler.finish_capture()
+    await cursor_coalescer.stop()
+    await presence_batcher.stop()
+    await spectator_fanout.stop()
+    await hub.stop()
+    # Persist every live room before shutting down
+    await document_store.stop()
+    provider_executor.shutdown()
 
 app = FastAPI(
     title="Real-Time Pair Programming API",
     description="A collaborative coding platform with WebSocket support",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -24,10 +59,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Times a sample of requests when PROFILE_SAMPLE_RATE (or the admin API) enables it
+app.add_middleware(RequestProfilingMiddleware)
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    """Report an exhausted connection pool as a retryable error"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Database busy, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
 # Include routers
 app.include_router(rooms.router, prefix="/api", tags=["rooms"])
 app.include_router(autocomplete.router, prefix="/api", tags=["autocomplete"])
 app.include_router(websocket.router, tags=["websocket"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
 
 @app.get("/")
 async def root():
@@ -38,10 +86,33 @@ async def root():
         "version": "1.0.0"
     }
 
+async def ping_database():
+    """Run a trivial query on a pooled connection"""
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
 @app.get("/health")
 async def health_check():
-    """Detailed health check"""
+    """Detailed health check, including a round trip to the database"""
+    try:
+        # Bounds waiting for a pooled connection as well as the query
+        await asyncio.wait_for(ping_database(), HEALTH_CHECK_TIMEOUT)
+    except Exception as e:
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy",
+                "database": "unavailable",
+                "error": type(e).__name__
+            }
+        )
+    
     return {
         "status": "healthy",
         "database": "connected"
     }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Metrics of this process in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -1,7 +1,7 @@
 """
 Database models
 """
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Integer, LargeBinary, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -18,14 +18,57 @@ class Room(Base):
     code_state = relationship("CodeState", back_populates="room", uselist=False, cascade="all, delete-orphan")
 
 class CodeState(Base):
-    """Code state model for storing current code in each room"""
+    """
+    Code state model for each room
+    
+    `code` holds the document at `checkpoint_version`; the edits after it, up
+    to `version`, are stored as CodeRevision deltas.
+    """
     __tablename__ = "code_states"
     
     id = Column(String, primary_key=True, index=True)
     room_id = Column(String, ForeignKey("rooms.id"), unique=True)
     code = Column(Text, default="")
     language = Column(String, default="python")
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Latest stored document version and its epoch (see RoomDocument)
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    epoch = Column(String, nullable=True)
+    # Version of the document held in `code`
+    checkpoint_version = Column(Integer, nullable=False, default=0, server_default="0")
+    # Indexed to find rooms that have gone cold
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     # Relationship to room
     room = relationship("Room", back_populates="code_state")
+
+class CodeRevision(Base):
+    """
+    Stored revision of a room's document
+    
+    A checkpoint holds the compressed document at `version`; a delta holds the
+    compressed edits from `base_version` up to `version`.
+    """
+    __tablename__ = "code_revisions"
+    __table_args__ = (UniqueConstraint("room_id", "kind", "version"),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    room_id = Column(String, ForeignKey("rooms.id"), index=True, nullable=False)
+    kind = Column(String, nullable=False)
+    base_version = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ArchivedRoom(Base):
+    """
+    Room that has not been edited for a long time
+    
+    `data` holds the room's code state and revisions, compressed. The room is
+    moved back to the rooms table the next time it is opened.
+    """
+    __tablename__ = "archived_rooms"
+    
+    room_id = Column(String, primary_key=True)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,83 @@
+"""
+Administrative endpoints for profiling a running worker
+"""
+import hmac
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from app.schemas import ProfileCaptureRequest, ProfilingSettings
+from app.services.profiler import PROFILE_MAX_SECONDS, profiler
+
+# Token expected in the X-Admin-Token header; the admin API is disabled when empty
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Reject requests without the admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.get("/admin/profiling")
+async def get_profiling():
+    """
+    Get this worker's profiling settings and captures
+    
+    Returns:
+        Sample rate, running and last capture, and capture files
+    """
+    return profiler.status()
+
+@router.put("/admin/profiling")
+async def update_profiling(settings: ProfilingSettings):
+    """
+    Change the fraction of messages and requests timed stage by stage
+    
+    Args:
+        settings: New sample rate (0 turns sampling off)
+        
+    Returns:
+        The updated profiling status
+    """
+    profiler.sample_rate = settings.sampleRate
+    return profiler.status()
+
+@router.post("/admin/profiling/rooms/{room_id}", status_code=202)
+async def start_room_capture(room_id: str, request: ProfileCaptureRequest):
+    """
+    Capture a cProfile trace of one room's message handling
+    
+    The trace is written to the profile directory once `seconds` have passed
+    or the capture is stopped.
+    
+    Args:
+        room_id: The room identifier
+        request: Length of the capture
+        
+    Returns:
+        The capture's status, including the file it will be written to
+    """
+    if request.seconds > PROFILE_MAX_SECONDS:
+        raise HTTPException(status_code=422, detail=f"Captures are limited to {PROFILE_MAX_SECONDS:g} seconds")
+    
+    try:
+        return profiler.start_capture(room_id, request.seconds)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.delete("/admin/profiling/capture")
+async def stop_capture():
+    """
+    Stop the running capture early and write it to disk
+    
+    Returns:
+        The finished capture's status and summary
+    """
+    status = profiler.finish_capture()
+    
+    if status is None:
+        raise HTTPException(status_code=404, detail="No capture is running")
+    
+    return status
@@ -1,12 +1,46 @@
 """
 Autocomplete endpoint
 """
+from typing import Optional, Tuple
 from fastapi import APIRouter
-from app.schemas import AutocompleteRequest, AutocompleteResponse
+from app.schemas import (
+    AutocompleteBatchRequest,
+    AutocompleteBatchResponse,
+    AutocompleteRequest,
+    AutocompleteResponse,
+)
+from app.services.autocomplete_scheduler import autocomplete_scheduler
 from app.services.autocomplete_service import AutocompleteService
+from app.services.document_store import document_store
+from app.services.provider_executor import provider_executor
+from app.services.symbol_index import SymbolIndex
 
 router = APIRouter()
 
+def request_index(room_id: Optional[str], code: str) -> Tuple[str, Optional[SymbolIndex]]:
+    """
+    Pick the code and symbol index to suggest against for a REST request
+    
+    The room's index follows the server's copy of the document, so it is only
+    used when the request carries that same text. Other text gets an index of
+    its own, so clients cannot rewrite the room's index (or make the next
+    WebSocket request re-scan the whole document).
+    
+    Args:
+        room_id: Room the request refers to, if any
+        code: Code sent with the request
+        
+    Returns:
+        The code and the index to use (None without a room)
+    """
+    document = document_store.get(room_id) if room_id else None
+    if document is None:
+        return code, None
+    
+    if code == document.code:
+        return document.code, document.symbols
+    return code, SymbolIndex()
+
 @router.post("/autocomplete", response_model=AutocompleteResponse)
 async def get_autocomplete(request: AutocompleteRequest):
     """
@@ -18,14 +52,93 @@ async def get_autocomplete(request: AutocompleteRequest):
     Returns:
         AutocompleteResponse with suggestion and confidence score
     """
-    result = AutocompleteService.get_suggestion(
-        code=request.code,
-        cursor_position=request.cursorPosition,
-        language=request.language
+    # Use the room's symbol index while the room is open
+    code, symbols = request_index(request.roomId, request.code)
+    
+    # A newer request from the same user supersedes this one
+    key = (request.roomId, request.userId) if request.userId else None
+    result = await autocomplete_scheduler.run(
+        key,
+        AutocompleteService.get_suggestion_async,
+        code,
+        request.cursorPosition,
+        request.language,
+        symbols
     )
     
+    if result is None:
+        return AutocompleteResponse(
+            suggestion="",
+            confidence=0.0,
+            description="Superseded by a newer request"
+        )
+    
     return AutocompleteResponse(
         suggestion=result["suggestion"],
         confidence=result["confidence"],
         description=result.get("description")
     )
+
+@router.post("/autocomplete/batch", response_model=AutocompleteBatchResponse)
+async def get_autocomplete_batch(request: AutocompleteBatchRequest):
+    """
+    Get suggestions for several cursor positions in one document
+    
+    Serves multi-cursor editing and prefetching of likely next positions in
+    one round trip. The document is indexed once for the whole batch.
+    
+    Args:
+        request: AutocompleteBatchRequest containing code, cursor positions, and language
+        
+    Returns:
+        AutocompleteBatchResponse with one suggestion per cursor position, in order
+    """
+    code, symbols = request_index(request.roomId, request.code)
+    
+    # A newer batch from the same user supersedes this one, leaving single requests alone
+    key = (request.roomId, request.userId, "batch") if request.userId else None
+    results = await autocomplete_scheduler.run(
+        key,
+        AutocompleteService.get_suggestions_async,
+        code,
+        request.cursorPositions,
+        request.language,
+        symbols
+    )
+    
+    if results is None:
+        results = [{
+            "suggestion": "",
+            "confidence": 0.0,
+            "description": "Superseded by a newer request"
+        }] * len(request.cursorPositions)
+    elif isinstance(results, dict):
+        # The batch missed its deadline
+        results = [results] * len(request.cursorPositions)
+    
+    return AutocompleteBatchResponse(
+        suggestions=[
+            AutocompleteResponse(
+                suggestion=result["suggestion"],
+                confidence=result["confidence"],
+                description=result.get("description")
+            )
+            for result in results
+        ]
+    )
+
+@router.get("/autocomplete/stats")
+async def get_autocomplete_stats():
+    """
+    Get suggestion cache and scheduler statistics
+    
+    Returns:
+        Cache size, limits, and hit/miss/eviction counters, plus the
+        scheduler's pending/superseded/timed-out counters under "scheduler"
+        and the provider pool's load under "executor"
+    """
+    return {
+        **AutocompleteService.cache.stats(),
+        "scheduler": autocomplete_scheduler.stats(),
+        "executor": provider_executor.stats()
+    }
@@ -1,50 +1,114 @@
 """
 Room management endpoints
 """
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.schemas import RoomCreate, RoomResponse
+from app.services.document_store import document_store
+from app.services.revision_service import RevisionService
+from app.services.room_cache import room_etag
 from app.services.room_service import RoomService
 
 router = APIRouter()
 
 @router.post("/rooms", response_model=RoomResponse, status_code=201)
-async def create_room(db: Session = Depends(get_db)):
+async def create_room(db: AsyncSession = Depends(get_db)):
     """
     Create a new collaboration room
     
     Returns:
         RoomResponse: Contains roomId and creation timestamp
     """
-    room = RoomService.create_room(db)
+    room = await RoomService.create_room(db)
     
     return RoomResponse(
         roomId=room.id,
         created_at=room.created_at
     )
 
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches an entity tag"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
 @router.get("/rooms/{room_id}")
-async def get_room(room_id: str, db: Session = Depends(get_db)):
+async def get_room(
+    room_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_db)
+):
     """
     Get room information by ID
     
+    The response carries an ETag; a request with a matching If-None-Match
+    header gets 304 Not Modified without a body.
+    
     Args:
         room_id: The room identifier
         
     Returns:
         Room information including current code state
     """
-    room = RoomService.get_room(db, room_id)
+    snapshot = await RoomService.get_room_snapshot(db, room_id)
+    
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="Room not found")
+    
+    # Live rooms are authoritative in memory; the database may lag behind
+    document = document_store.get(room_id)
+    if document is not None:
+        code, language = document.code, document.language
+        etag = room_etag(room_id, code, language)
+    else:
+        code, language, etag = snapshot.code, snapshot.language, snapshot.etag
+    
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    
+    response.headers.update(headers)
+    return {
+        "roomId": snapshot.room_id,
+        "created_at": snapshot.created_at,
+        "code": code,
+        "language": language
+    }
+
+@router.get("/rooms/{room_id}/revisions/{version}")
+async def get_room_revision(room_id: str, version: int, db: AsyncSession = Depends(get_db)):
+    """
+    Get a room's document as it was at a version
     
-    if not room:
+    Args:
+        room_id: The room identifier
+        version: Document version
+        
+    Returns:
+        The room ID, version, and code at that version
+    """
+    # Unknown rooms are reported as such; archived rooms are restored
+    if await RoomService.get_room_snapshot(db, room_id) is None:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    code_state = RoomService.get_code_state(db, room_id)
+    # Write the live room's latest edits first (or wait for the flush already
+    # writing them) so they can be read back
+    await document_store.flush({room_id})
+    
+    code = await RevisionService.get_revision(db, room_id, version)
+    
+    if code is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
     
     return {
-        "roomId": room.id,
-        "created_at": room.created_at,
-        "code": code_state.code if code_state else "",
-        "language": code_state.language if code_state else "python"
+        "roomId": room_id,
+        "version": version,
+        "code": code
     }
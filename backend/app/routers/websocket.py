@@ -1,174 +1,239 @@
 """
 WebSocket endpoint for real-time collaboration
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from sqlalchemy.orm import Session
-from typing import Dict, Set
-import json
-from datetime import datetime
-from app.database import get_db
+import asyncio
+import time
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from app.database import SessionLocal
 from app.services.room_service import RoomService
+from app.services.autocomplete_scheduler import autocomplete_scheduler
+from app.services.autocomplete_service import AutocompleteService
+from app.services.collaboration import hub
+from app.services.connection_manager import manager
+from app.services.document_store import document_store
+from app.services.metrics import WS_RECEIVE_TO_BROADCAST_SECONDS
+from app.services.presence import cursor_coalescer, presence_batcher
+from app.services.profiler import profiler
+from app.services.wire_format import decode_message, negotiate_encoding, receive_frame
 
 router = APIRouter()
 
-# Connection manager to handle WebSocket connections
-class ConnectionManager:
-    """Manages WebSocket connections for each room"""
-    
-    def __init__(self):
-        # Dictionary mapping room_id to set of active connections
-        self.active_connections: Dict[str, Set[WebSocket]] = {}
+# Profiling route of each message type clients send; others are grouped
+MESSAGE_ROUTES = {
+    message_type: f"ws:{message_type}"
+    for message_type in ("code_update", "operation", "autocomplete_request", "cursor_move")
+}
+
+# Running autocomplete tasks, referenced until they finish
+autocomplete_tasks = set()
+
+def start_autocomplete_request(client, document, message: dict, received: float):
+    """Answer an autocomplete request in the background, latest request wins"""
+    task = asyncio.create_task(handle_autocomplete_request(client, document, message, received))
+    autocomplete_tasks.add(task)
+    task.add_done_callback(autocomplete_tasks.discard)
+
+async def handle_autocomplete_request(client, document, message: dict, received: float):
+    """
+    Answer an autocomplete request on the requesting socket
     
-    async def connect(self, websocket: WebSocket, room_id: str):
-        """Accept and register a new WebSocket connection"""
-        await websocket.accept()
-        
-        if room_id not in self.active_connections:
-            self.active_connections[room_id] = set()
-        
-        self.active_connections[room_id].add(websocket)
+    Args:
+        client: The requesting connection
+        document: The room's live document
+        message: Request with cursorPosition, optional version, language and requestId
+        received: perf_counter() time the request was received
+    """
+    try:
+        cursor_position = max(0, int(message.get("cursorPosition", 0)))
+        version = message.get("version")
+        version = int(version) if version is not None else None
+    except (TypeError, ValueError):
+        client.send({"type": "error", "message": "invalid autocomplete request"})
+        return
     
-    def disconnect(self, websocket: WebSocket, room_id: str):
-        """Remove a WebSocket connection"""
-        if room_id in self.active_connections:
-            self.active_connections[room_id].discard(websocket)
-            
-            # Clean up empty rooms
-            if not self.active_connections[room_id]:
-                del self.active_connections[room_id]
+    # Map the client's cursor onto the current document
+    if version is not None:
+        cursor_position = document.transform_position(cursor_position, version)
     
-    async def broadcast(self, room_id: str, message: dict, exclude: WebSocket = None):
-        """
-        Broadcast a message to all connections in a room
-        
-        Args:
-            room_id: The room to broadcast to
-            message: The message to send
-            exclude: Optional WebSocket to exclude from broadcast (e.g., sender)
-        """
-        if room_id not in self.active_connections:
+    if cursor_position is None:
+        result = {
+            "suggestion": "",
+            "confidence": 0.0,
+            "description": "Document version too old"
+        }
+    else:
+        try:
+            result = await autocomplete_scheduler.run(
+                (client.room_id, client.client_id),
+                AutocompleteService.get_suggestion_async,
+                document.code,
+                cursor_position,
+                message.get("language") or document.language,
+                document.symbols
+            )
+        except Exception as e:
+            # Still answer, so the client is not left waiting on its requestId
+            print(f"Autocomplete error: {e}")
+            result = {
+                "suggestion": "",
+                "confidence": 0.0,
+                "description": "Suggestion failed"
+            }
+        if result is None:
+            # Superseded by a newer request from the same client
             return
-        
-        # Create a copy to avoid modification during iteration
-        connections = self.active_connections[room_id].copy()
-        
-        for connection in connections:
-            if connection != exclude:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    # Remove dead connections
-                    self.disconnect(connection, room_id)
     
-    def get_connection_count(self, room_id: str) -> int:
-        """Get number of active connections in a room"""
-        return len(self.active_connections.get(room_id, set()))
-
-# Global connection manager instance
-manager = ConnectionManager()
+    client.send({
+        "type": "autocomplete_response",
+        "requestId": message.get("requestId"),
+        "version": document.version,
+        **result
+    })
+    WS_RECEIVE_TO_BROADCAST_SECONDS.observe(time.perf_counter() - received, ("autocomplete_request",))
 
 @router.websocket("/ws/{room_id}")
-async def websocket_endpoint(websocket: WebSocket, room_id: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    room_id: str,
+    protocol: str = "snapshot",
+    encoding: str = "json",
+    since: Optional[int] = None,
+    epoch: Optional[str] = None,
+    role: str = "editor",
+    userId: Optional[str] = None
+):
     """
     WebSocket endpoint for real-time code collaboration
     
     Args:
         websocket: WebSocket connection
         room_id: Room identifier
+        protocol: "ot" to exchange versioned operations, "snapshot" (default)
+            to exchange the full document on every change
+        encoding: "msgpack" for binary MessagePack frames, "json" (default)
+            for text frames
+        since: Version the client last saw, when reconnecting
+        epoch: Epoch of that version, from the init message
+        role: "spectator" to follow the room read-only, "editor" (default)
+            to take part
+        userId: Name shown for this connection in the room's roster
     """
-    # Get database session
-    db = next(get_db())
+    document = None
+    client = None
+    spectator = role == "spectator"
     
     try:
-        # Verify room exists
-        room = RoomService.get_room(db, room_id)
-        if not room:
-            await websocket.close(code=4004, reason="Room not found")
-            return
+        # Only hold a pooled connection while loading the room, not for the
+        # lifetime of the socket
+        async with SessionLocal() as db:
+            # Verify room exists (usually answered by the room cache)
+            snapshot = await RoomService.get_room_snapshot(db, room_id)
+            if snapshot is None:
+                await websocket.close(code=4004, reason="Room not found")
+                return
+            
+            # Get the authoritative in-memory document
+            document = await document_store.acquire(db, room_id)
         
-        # Connect the WebSocket
-        await manager.connect(websocket, room_id)
+        await hub.join(room_id, document)
         
-        # Get current code state
-        code_state = RoomService.get_code_state(db, room_id)
+        # Connect the WebSocket; nothing can be queued for it before init
+        encoding = negotiate_encoding(encoding)
+        client = await manager.connect(
+            websocket, room_id, protocol, encoding, spectator=spectator, user_id=userId
+        )
         
-        # Send initial state to the newly connected client
-        await websocket.send_json({
+        # Send initial state to the newly connected client: only the missed
+        # edits when it is reconnecting and they are still in the log
+        init = {
             "type": "init",
-            "code": code_state.code if code_state else "",
-            "language": code_state.language if code_state else "python",
-            "connectionCount": manager.get_connection_count(room_id)
-        })
+            "language": document.language,
+            "version": document.version,
+            "epoch": document.epoch,
+            "encoding": encoding,
+            "role": "spectator" if spectator else "editor",
+            "userId": client.user_id,
+            "users": manager.get_roster(room_id),
+            "connectionCount": manager.get_connection_count(room_id),
+            "spectatorCount": manager.get_spectator_count(room_id)
+        }
+        changes = document.changes_since(epoch, since) if since is not None else None
+        if changes is not None:
+            init["resync"] = True
+            init["baseVersion"] = since
+            init["changes"] = [{"version": version, "ops": ops} for version, ops in changes]
+        else:
+            init["code"] = document.code
+        client.send(init)
         
-        # Notify others that someone joined
-        await manager.broadcast(
-            room_id,
-            {
-                "type": "user_joined",
-                "connectionCount": manager.get_connection_count(room_id),
-                "timestamp": datetime.utcnow().isoformat()
-            },
-            exclude=websocket
-        )
+        if spectator:
+            # Spectators are not announced and cannot change the room
+            while True:
+                message = decode_message(await receive_frame(websocket))
+                if message.get("type") in ("code_update", "operation"):
+                    client.send({"type": "error", "message": "Spectators cannot edit this room"})
+        
+        # Announced to the room with the other joins in this window
+        presence_batcher.changed(room_id)
         
         # Listen for messages
         while True:
             # Receive message from client
-            data = await websocket.receive_text()
-            message = json.loads(data)
+            data = await receive_frame(websocket)
+            received = time.perf_counter()
             
-            message_type = message.get("type")
-            
-            if message_type == "code_update":
-                # Update code in database
-                code = message.get("code", "")
-                language = message.get("language", "python")
-                
-                RoomService.update_code_state(db, room_id, code, language)
+            # Sampled or not, every stage of this message follows the same decision
+            with profiler.sampling():
+                started = profiler.start()
+                message = decode_message(data)
+                message_type = message.get("type")
+                route = MESSAGE_ROUTES.get(message_type, "ws:other")
+                profiler.record(route, "decode", started)
                 
-                # Broadcast to all other clients in the room
-                await manager.broadcast(
-                    room_id,
-                    {
-                        "type": "code_update",
-                        "code": code,
-                        "cursorPosition": message.get("cursorPosition"),
-                        "userId": message.get("userId"),
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    exclude=websocket
-                )
-            
-            elif message_type == "cursor_move":
-                # Broadcast cursor position to other clients
-                await manager.broadcast(
-                    room_id,
-                    {
-                        "type": "cursor_move",
-                        "cursorPosition": message.get("cursorPosition"),
-                        "userId": message.get("userId"),
-                        "timestamp": datetime.utcnow().isoformat()
-                    },
-                    exclude=websocket
-                )
+                started = profiler.start()
+                with profiler.capturing(room_id):
+                    if message_type == "code_update":
+                        # Full-snapshot update from a client without operation support
+                        await hub.submit_code_update(client, message, received)
+                    
+                    elif message_type == "operation":
+                        # Versioned insert/delete operations; only the edit travels
+                        await hub.submit_operation(client, message, received)
+                    
+                    elif message_type == "autocomplete_request":
+                        # Suggest against the server's copy; only the cursor is sent
+                        start_autocomplete_request(client, document, message, received)
+                    
+                    elif message_type == "cursor_move":
+                        # Coalesced with other cursor moves and sent on the next tick
+                        cursor_coalescer.update(
+                            room_id,
+                            message.get("userId") or client.user_id,
+                            message.get("cursorPosition")
+                        )
+                profiler.record(route, "dispatch", started)
     
     except WebSocketDisconnect:
         # Handle disconnection
-        manager.disconnect(websocket, room_id)
+        await manager.disconnect(client)
         
-        # Notify others that someone left
-        await manager.broadcast(
-            room_id,
-            {
-                "type": "user_left",
-                "connectionCount": manager.get_connection_count(room_id),
-                "timestamp": datetime.utcnow().isoformat()
-            }
-        )
+        # Announced to the room with the other leaves in this window
+        if not spectator:
+            presence_batcher.changed(room_id)
+    
+    except PoolTimeoutError:
+        # No pooled connection became free in time; the client should retry
+        await websocket.close(code=1013, reason="Database busy")
     
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(websocket, room_id)
+        if client is not None:
+            await manager.disconnect(client)
+            if not spectator:
+                presence_batcher.changed(room_id)
     
     finally:
-        db.close()
+        if document is not None:
+            await document_store.release(room_id)
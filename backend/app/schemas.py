@@ -1,8 +1,8 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, Field, conint
+from typing import List, Optional
 from datetime import datetime
 
 class RoomCreate(BaseModel):
@@ -22,6 +22,8 @@ class AutocompleteRequest(BaseModel):
     code: str = Field(..., description="Current code content")
     cursorPosition: int = Field(..., ge=0, description="Cursor position in the code")
     language: str = Field(default="python", description="Programming language")
+    userId: Optional[str] = Field(default=None, description="Requesting user; a newer request from the same user cancels this one")
+    roomId: Optional[str] = Field(default=None, description="Room the request belongs to")
 
 class AutocompleteResponse(BaseModel):
     """Schema for autocomplete response"""
@@ -29,6 +31,26 @@ class AutocompleteResponse(BaseModel):
     confidence: float = Field(ge=0.0, le=1.0)
     description: Optional[str] = None
 
+class AutocompleteBatchRequest(BaseModel):
+    """Schema for a batch autocomplete request (one document, many cursors)"""
+    code: str = Field(..., description="Current code content")
+    cursorPositions: List[conint(ge=0)] = Field(..., min_length=1, max_length=64, description="Cursor positions in the code")
+    language: str = Field(default="python", description="Programming language")
+    userId: Optional[str] = Field(default=None, description="Requesting user; a newer batch from the same user cancels this one")
+    roomId: Optional[str] = Field(default=None, description="Room the request belongs to")
+
+class AutocompleteBatchResponse(BaseModel):
+    """Schema for a batch autocomplete response"""
+    suggestions: List[AutocompleteResponse] = Field(..., description="One suggestion per cursor position, in request order")
+
+class ProfilingSettings(BaseModel):
+    """Schema for changing the profiling sample rate"""
+    sampleRate: float = Field(..., ge=0.0, le=1.0, description="Fraction of messages and requests timed stage by stage")
+
+class ProfileCaptureRequest(BaseModel):
+    """Schema for starting a profiler capture of one room"""
+    seconds: float = Field(default=10.0, gt=0, description="Length of the capture")
+
 class CodeUpdateMessage(BaseModel):
     """Schema for WebSocket code update messages"""
     type: str = Field(default="code_update")
@@ -0,0 +1,105 @@
+"""
+Latest-wins scheduling of autocomplete requests
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+from app.services.metrics import AUTOCOMPLETE_SECONDS
+
+# Milliseconds before an unfinished suggestion is abandoned
+AUTOCOMPLETE_DEADLINE_MS = int(os.getenv("AUTOCOMPLETE_DEADLINE_MS", "300"))
+
+# Returned when a suggestion misses its deadline
+DEADLINE_SUGGESTION = {
+    "suggestion": "",
+    "confidence": 0.0,
+    "description": "Suggestion deadline exceeded"
+}
+
+
+class _PendingRequest:
+    """A running autocomplete request"""
+
+    __slots__ = ("task", "superseded")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.superseded = False
+
+
+class AutocompleteScheduler:
+    """
+    Runs autocomplete requests as cancellable tasks, one per key
+
+    A newer request for the same key (e.g. the same user in the same room)
+    cancels the older one, so stale requests stop competing for CPU with the
+    one that matters. Requests that run past the deadline return an empty
+    suggestion.
+    """
+
+    def __init__(self, deadline_ms: int = AUTOCOMPLETE_DEADLINE_MS):
+        self.deadline = deadline_ms / 1000
+        self._pending: Dict[Hashable, _PendingRequest] = {}
+        self.superseded = 0
+        self.timed_out = 0
+
+    async def run(self, key: Optional[Hashable], func: Callable[..., Awaitable[Dict]], *args) -> Optional[Dict]:
+        """
+        Compute a suggestion, superseding any earlier request with the same key
+
+        Args:
+            key: Requests sharing a key cancel each other; None disables this
+            func: Coroutine function computing the suggestion
+            *args: Arguments for `func`
+
+        Returns:
+            The suggestion, DEADLINE_SUGGESTION if the deadline passed, or
+            None if a newer request with the same key replaced this one
+        """
+        previous = self._pending.pop(key, None) if key is not None else None
+        if previous is not None and not previous.task.done():
+            previous.superseded = True
+            previous.task.cancel()
+            self.superseded += 1
+
+        request = _PendingRequest(asyncio.ensure_future(self._compute(func, *args)))
+        if key is not None:
+            self._pending[key] = request
+
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(request.task, self.deadline)
+            AUTOCOMPLETE_SECONDS.observe(time.perf_counter() - start, ("ok",))
+            return result
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            AUTOCOMPLETE_SECONDS.observe(time.perf_counter() - start, ("timeout",))
+            return dict(DEADLINE_SUGGESTION)
+        except asyncio.CancelledError:
+            if request.superseded:
+                AUTOCOMPLETE_SECONDS.observe(time.perf_counter() - start, ("superseded",))
+                return None
+            raise
+        finally:
+            if key is not None and self._pending.get(key) is request:
+                del self._pending[key]
+
+    async def _compute(self, func: Callable[..., Awaitable[Dict]], *args) -> Dict:
+        """Compute a suggestion unless superseded before it starts"""
+        # Let a burst of requests arrive so only the newest one does the work
+        await asyncio.sleep(0)
+        return await func(*args)
+
+    def stats(self) -> Dict:
+        """Scheduler counters"""
+        return {
+            "pending": len(self._pending),
+            "superseded": self.superseded,
+            "timedOut": self.timed_out,
+            "deadlineMs": self.deadline * 1000
+        }
+
+
+# Global autocomplete scheduler instance
+autocomplete_scheduler = AutocompleteScheduler()
@@ -2,7 +2,60 @@
 AI Autocomplete service (mocked implementation)
 """
 import re
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+from app.services.symbol_index import MAX_INLINE_RESCAN_LINES, PREFIX_PATTERN, Symbol, SymbolIndex
+from app.services.provider_executor import BUSY_SUGGESTION, provider_executor
+from app.services.suggestion_cache import SuggestionCache
+
+# Key under which a trie node stores the trigger ending there
+_MATCH = ""
+
+# Longest stretch of the current line examined before the cursor
+MAX_CONTEXT_CHARS = 512
+
+class TriggerTrie:
+    """
+    Reverse-suffix trie of autocomplete triggers
+    
+    Triggers are inserted back to front, so matching walks the line from its
+    last character and only visits as many nodes as the longest trigger that
+    could end the line, however many triggers a language has.
+    """
+    
+    def __init__(self, suggestions: Dict[str, str]):
+        self.root: Dict = {}
+        
+        for priority, (trigger, suggestion) in enumerate(suggestions.items()):
+            key = trigger.strip()
+            node = self.root
+            for char in reversed(key):
+                node = node.setdefault(char, {})
+            # Earlier triggers win, matching the order of the suggestion table
+            node.setdefault(_MATCH, (priority, key, suggestion))
+    
+    def match(self, line: str) -> Optional[Tuple[str, str]]:
+        """
+        Find the trigger the line ends with
+        
+        Args:
+            line: Current line of code
+            
+        Returns:
+            (trigger, suggestion) for the highest-priority match, or None
+        """
+        best = None
+        node = self.root
+        end = len(line.rstrip())
+        
+        for index in range(end - 1, -1, -1):
+            node = node.get(line[index])
+            if node is None:
+                break
+            found = node.get(_MATCH)
+            if found is not None and (best is None or found[0] < best[0]):
+                best = found
+        
+        return (best[1], best[2]) if best is not None else None
 
 class AutocompleteService:
     """Service for providing autocomplete suggestions"""
@@ -32,6 +85,23 @@ class AutocompleteService:
         "import ": "import module from 'module';",
     }
     
+    # Trigger tries, built once at import
+    PYTHON_TRIGGERS = TriggerTrie(PYTHON_SUGGESTIONS)
+    JAVASCRIPT_TRIGGERS = TriggerTrie(JAVASCRIPT_SUGGESTIONS)
+    
+    # Context patterns folded into one precompiled matcher
+    ADVANCED_PATTERN = re.compile(
+        r'(?P<assignment>\w+\s*=\s*$)'   # Variable assignment
+        r'|(?P<call>\w+\($)'             # Function call
+        r'|(?P<index>\w+\[$)'            # Array/List access
+    )
+    
+    # Memoized suggestions keyed on (provider, language, normalized line)
+    cache = SuggestionCache()
+    
+    # Suggestion provider, set below
+    provider: "AutocompleteProvider" = None
+    
     @staticmethod
     def get_suggestion(code: str, cursor_position: int, language: str = "python") -> Dict:
         """
@@ -45,31 +115,187 @@ class AutocompleteService:
         Returns:
             Dictionary with suggestion, confidence, and description
         """
-        # Get the text before cursor
-        text_before_cursor = code[:cursor_position]
-        
         # Get last line before cursor
-        lines = text_before_cursor.split('\n')
-        current_line = lines[-1] if lines else ""
-        
-        # Select appropriate suggestions based on language
-        suggestions = (
-            AutocompleteService.PYTHON_SUGGESTIONS 
-            if language.lower() == "python" 
-            else AutocompleteService.JAVASCRIPT_SUGGESTIONS
+        current_line = AutocompleteService.get_line_context(code, cursor_position)
+        
+        return AutocompleteService.suggest_for_line(current_line, language)
+    
+    @staticmethod
+    def suggest_for_line(line: str, language: str = "python") -> Dict:
+        """
+        Get a suggestion for the current line, consulting the cache first
+        
+        Args:
+            line: Current line up to the cursor
+            language: Programming language
+            
+        Returns:
+            Dictionary with suggestion, confidence, and description
+        """
+        provider = AutocompleteService.provider
+        key = (provider.name, language.lower(), provider.normalize(line), ())
+        
+        result = AutocompleteService.cache.get(key)
+        if result is None:
+            result = provider.suggest(line, language)
+            AutocompleteService.cache.put(key, result)
+        
+        return result
+    
+    @staticmethod
+    async def get_suggestion_async(
+        code: str,
+        cursor_position: int,
+        language: str = "python",
+        symbols: Optional[SymbolIndex] = None
+    ) -> Dict:
+        """
+        Generate a suggestion without running the provider on the event loop
+        
+        The line lookup, symbol lookup and cache stay on the loop; on a miss
+        the provider runs in the provider executor.
+        
+        Args:
+            code: Current code content
+            cursor_position: Position of cursor in code
+            language: Programming language
+            symbols: The room's symbol index, updated to `code` before use
+            
+        Returns:
+            Dictionary with suggestion, confidence, and description
+            (BUSY_SUGGESTION if the executor is saturated)
+        """
+        results = await AutocompleteService.get_suggestions_async(code, [cursor_position], language, symbols)
+        return results[0]
+    
+    @staticmethod
+    async def get_suggestions_async(
+        code: str,
+        cursor_positions: List[int],
+        language: str = "python",
+        symbols: Optional[SymbolIndex] = None
+    ) -> List[Dict]:
+        """
+        Generate suggestions for several cursors in one document
+        
+        The symbol index is brought up to date once for the whole batch,
+        cursors whose context is the same share one suggestion, and every
+        cache miss is computed in a single call to the provider executor.
+        
+        Args:
+            code: Current code content
+            cursor_positions: Positions of the cursors in code
+            language: Programming language
+            symbols: The room's symbol index, updated to `code` before use
+            
+        Returns:
+            One suggestion dictionary per cursor, in order
+        """
+        if symbols is not None and not await AutocompleteService._update_index(symbols, code):
+            # Too busy to index the document; suggest without hints
+            symbols = None
+        
+        provider = AutocompleteService.provider
+        language_key = language.lower()
+        keys = []
+        results: Dict[Tuple, Dict] = {}
+        # key -> (line, hints) for suggestions the cache does not have
+        missing: Dict[Tuple, Tuple[str, Tuple[Symbol, ...]]] = {}
+        
+        for cursor_position in cursor_positions:
+            line = AutocompleteService.get_line_context(code, cursor_position)
+            hints = symbols.hints(line) if symbols is not None else ()
+            key = (provider.name, language_key, provider.normalize(line), hints)
+            keys.append(key)
+            
+            if key in results or key in missing:
+                continue
+            cached = AutocompleteService.cache.get(key)
+            if cached is None:
+                missing[key] = (line, hints)
+            else:
+                results[key] = cached
+        
+        if missing:
+            computed = await provider_executor.submit(
+                AutocompleteService._suggest_lines, provider, language, list(missing.values())
+            )
+            for key, result in zip(missing, computed or [BUSY_SUGGESTION] * len(missing)):
+                if computed is not None:
+                    AutocompleteService.cache.put(key, result)
+                results[key] = result
+        
+        return [dict(results[key]) for key in keys]
+    
+    @staticmethod
+    async def _update_index(symbols: SymbolIndex, code: str) -> bool:
+        """
+        Bring a symbol index up to date with `code` without stalling the loop
+        
+        Small edits are indexed in place. Large rescans (a newly loaded room,
+        a pasted file) build a fresh index in the provider executor, which
+        then replaces the index's state.
+        
+        Returns:
+            False if the executor was too busy to build the index
+        """
+        if provider_executor.kind != "inline" and symbols.rescan_lines(code) > MAX_INLINE_RESCAN_LINES:
+            built = await provider_executor.submit(SymbolIndex.build, code, symbols.max_symbols)
+            if built is None:
+                return False
+            # Edits indexed meanwhile are simply re-applied by update()
+            symbols.adopt(built)
+        
+        symbols.update(code)
+        return True
+    
+    @staticmethod
+    def _suggest_lines(
+        provider: "AutocompleteProvider",
+        language: str,
+        lines: List[Tuple[str, Tuple[Symbol, ...]]]
+    ) -> List[Dict]:
+        """Run the provider for (line, hints) pairs; called in the provider executor"""
+        return [provider.suggest(line, language, hints) for line, hints in lines]
+    
+    @staticmethod
+    def set_provider(provider: "AutocompleteProvider"):
+        """Replace the suggestion provider, dropping cached suggestions"""
+        AutocompleteService.provider = provider
+        AutocompleteService.cache.clear()
+    
+    @staticmethod
+    def match_rules(current_line: str, language: str, symbols: Tuple[Symbol, ...] = ()) -> Dict:
+        """
+        Generate a mocked suggestion from the trigger tables and patterns
+        
+        Args:
+            current_line: Current line up to the cursor
+            language: Programming language
+            symbols: Hints from the room's symbol index
+            
+        Returns:
+            Dictionary with suggestion, confidence, and description
+        """
+        # Select appropriate triggers based on language
+        triggers = (
+            AutocompleteService.PYTHON_TRIGGERS
+            if language.lower() == "python"
+            else AutocompleteService.JAVASCRIPT_TRIGGERS
         )
         
         # Check for matches
-        for trigger, suggestion in suggestions.items():
-            if current_line.strip().endswith(trigger.strip()):
-                return {
-                    "suggestion": suggestion,
-                    "confidence": 0.85,
-                    "description": f"Auto-complete for {trigger.strip()}"
-                }
+        match = triggers.match(current_line)
+        if match:
+            trigger, suggestion = match
+            return {
+                "suggestion": suggestion,
+                "confidence": 0.85,
+                "description": f"Auto-complete for {trigger}"
+            }
         
         # Advanced pattern matching
-        suggestion = AutocompleteService._advanced_suggestions(current_line, language)
+        suggestion = AutocompleteService._advanced_suggestions(current_line, language, symbols)
         if suggestion:
             return suggestion
         
@@ -81,11 +307,42 @@ class AutocompleteService:
         }
     
     @staticmethod
-    def _advanced_suggestions(line: str, language: str) -> Dict:
+    def get_line_context(code: str, cursor_position: int) -> str:
+        """
+        Get the current line up to the cursor
+        
+        Scans back from the cursor to the previous newline, looking at no more
+        than MAX_CONTEXT_CHARS characters, so the cost does not depend on the
+        size of the document.
+        
+        Args:
+            code: Current code content
+            cursor_position: Position of cursor in code
+            
+        Returns:
+            Text between the start of the line (or the window) and the cursor
+        """
+        position = min(cursor_position, len(code))
+        window_start = max(0, position - MAX_CONTEXT_CHARS)
+        newline = code.rfind('\n', window_start, position)
+        line_start = newline + 1 if newline != -1 else window_start
+        
+        return code[line_start:position]
+    
+    @staticmethod
+    def _advanced_suggestions(line: str, language: str, symbols: Tuple[Symbol, ...] = ()) -> Dict:
         """Provide advanced context-aware suggestions"""
+        if symbols:
+            suggestion = AutocompleteService._symbol_suggestions(line, symbols)
+            if suggestion:
+                return suggestion
+        
+        match = AutocompleteService.ADVANCED_PATTERN.search(line)
+        if not match:
+            return None
         
         # Variable assignment suggestion
-        if re.search(r'\w+\s*=\s*$', line):
+        if match.lastgroup == "assignment":
             if language.lower() == "python":
                 return {
                     "suggestion": "value",
@@ -94,7 +351,7 @@ class AutocompleteService:
                 }
         
         # Function call suggestion
-        if re.search(r'\w+\($', line):
+        if match.lastgroup == "call":
             return {
                 "suggestion": "parameter",
                 "confidence": 0.75,
@@ -102,7 +359,7 @@ class AutocompleteService:
             }
         
         # Array/List access
-        if re.search(r'\w+\[$', line):
+        if match.lastgroup == "index":
             return {
                 "suggestion": "0]",
                 "confidence": 0.8,
@@ -110,3 +367,68 @@ class AutocompleteService:
             }
         
         return None
+    
+    @staticmethod
+    def _symbol_suggestions(line: str, symbols: Tuple[Symbol, ...]) -> Dict:
+        """Suggest names defined in the document"""
+        # Parameters of a function being called
+        if line.endswith("(") and symbols[0].kind == "function":
+            if symbols[0].params:
+                return {
+                    "suggestion": symbols[0].params,
+                    "confidence": 0.8,
+                    "description": f"Parameters of {symbols[0].name}"
+                }
+            return None
+        
+        # Rest of the identifier being typed
+        match = PREFIX_PATTERN.search(line)
+        if match is None:
+            return None
+        
+        prefix = match.group(1)
+        for symbol in symbols:
+            if symbol.name.startswith(prefix) and symbol.name != prefix:
+                return {
+                    "suggestion": symbol.name[len(prefix):],
+                    "confidence": 0.8,
+                    "description": f"{symbol.kind.capitalize()} {symbol.name}"
+                }
+        
+        return None
+
+
+class AutocompleteProvider:
+    """Base class for suggestion providers behind AutocompleteService"""
+    
+    name = "base"
+    
+    def normalize(self, line: str) -> str:
+        """Reduce a line to the part that determines the suggestion (cache key)"""
+        return line
+    
+    def suggest(self, line: str, language: str, symbols: Tuple[Symbol, ...] = ()) -> Dict:
+        """
+        Compute a suggestion for the current line
+        
+        Args:
+            line: Current line up to the cursor
+            language: Programming language
+            symbols: Names from the room's symbol index relevant to the line
+        """
+        raise NotImplementedError
+
+class RuleBasedProvider(AutocompleteProvider):
+    """Mocked suggestions from trigger tables and context patterns"""
+    
+    name = "rules"
+    
+    def normalize(self, line: str) -> str:
+        """Indentation does not affect rule matches"""
+        return line.lstrip()
+    
+    def suggest(self, line: str, language: str, symbols: Tuple[Symbol, ...] = ()) -> Dict:
+        """Match the line against the rules"""
+        return AutocompleteService.match_rules(line, language, symbols)
+
+AutocompleteService.provider = RuleBasedProvider()
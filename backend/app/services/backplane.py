@@ -0,0 +1,196 @@
+"""
+Pub/sub backplane that orders room events across worker processes and nodes
+"""
+import asyncio
+import json
+import os
+import uuid
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+# Empty for a single process; redis://host:port/db to share rooms across processes
+BACKPLANE_URL = os.getenv("BACKPLANE_URL", "")
+
+# Prefix of the pub/sub channels carrying each room's events
+BACKPLANE_CHANNEL = os.getenv("BACKPLANE_CHANNEL", "pairprog:rooms")
+
+# Identifies this process in published events
+NODE_ID = uuid.uuid4().hex[:12]
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class Backplane:
+    """
+    Delivers each room's events, in one order, to every process holding it
+
+    Processes subscribe to the rooms they have loaded. Every subscribed
+    process, including the publisher, receives the room's events through the
+    handler passed to `start`, so all of them apply edits in the same order.
+    Events with a `target` go only to that process.
+    """
+
+    # Whether other processes may hold the same rooms
+    distributed = False
+
+    def __init__(self):
+        self._handler: Optional[EventHandler] = None
+        self.rooms: Set[str] = set()
+
+    async def start(self, handler: EventHandler):
+        """Start receiving events"""
+        self._handler = handler
+
+    def subscribed(self, room_id: str) -> bool:
+        """Whether this process receives a room's events"""
+        return room_id in self.rooms
+
+    async def subscribe(self, room_id: str):
+        """Start receiving a room's events"""
+        self.rooms.add(room_id)
+
+    async def unsubscribe(self, room_id: str):
+        """Stop receiving a room's events"""
+        self.rooms.discard(room_id)
+
+    async def publish(self, event: dict):
+        """Publish an event to the processes holding its room"""
+        raise NotImplementedError
+
+    async def stop(self):
+        """Stop receiving events"""
+        self._handler = None
+
+
+class InProcessBackplane(Backplane):
+    """Backplane for a single process: events are handled immediately"""
+
+    async def publish(self, event: dict):
+        """Handle the event in this process"""
+        if self._handler is not None:
+            await self._handler(event)
+
+
+class RedisBackplane(Backplane):
+    """
+    Backplane over Redis (or any Redis-compatible server) pub/sub
+
+    Each room has its own channel, so a process only receives the traffic of
+    the rooms it holds and per-process load falls as processes are added.
+    Each process also has a channel for events targeted at it.
+    """
+
+    distributed = True
+
+    def __init__(self, url: str, channel: str = BACKPLANE_CHANNEL):
+        super().__init__()
+        try:
+            import redis.asyncio as redis
+        except ImportError:
+            raise RuntimeError("BACKPLANE_URL requires the redis package") from None
+
+        self.channel = channel
+        self.node_channel = f"{channel}:node:{NODE_ID}"
+        self._redis = redis.from_url(url)
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        # Serializes (un)subscribe commands on the pub/sub connection
+        self._lock = asyncio.Lock()
+        # channel -> resolved once the server confirmed the subscription
+        self._confirmations: Dict[str, asyncio.Future] = {}
+
+    def room_channel(self, room_id: str) -> str:
+        """The channel carrying a room's events"""
+        return f"{self.channel}:room:{room_id}"
+
+    async def start(self, handler: EventHandler):
+        """Subscribe to this process's channel and start dispatching events"""
+        await super().start(handler)
+        self._pubsub = self._redis.pubsub()
+        # Also keeps the listener running while no rooms are held
+        await self._pubsub.subscribe(self.node_channel)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def subscribe(self, room_id: str):
+        """
+        Start receiving a room's events
+
+        Returns once the server confirmed the subscription, so every event
+        published afterwards is delivered.
+        """
+        if room_id in self.rooms:
+            return
+        await super().subscribe(room_id)
+
+        channel = self.room_channel(room_id)
+        confirmation = asyncio.get_running_loop().create_future()
+        self._confirmations[channel] = confirmation
+        async with self._lock:
+            await self._pubsub.subscribe(channel)
+        await confirmation
+
+    async def unsubscribe(self, room_id: str):
+        """Stop receiving a room's events"""
+        if room_id not in self.rooms:
+            return
+        await super().unsubscribe(room_id)
+
+        async with self._lock:
+            await self._pubsub.unsubscribe(self.room_channel(room_id))
+
+    async def publish(self, event: dict):
+        """Publish an event to the processes holding its room, or to its target"""
+        target = event.get("target")
+        channel = f"{self.channel}:node:{target}" if target else self.room_channel(event["room"])
+        await self._redis.publish(channel, json.dumps(event, separators=(",", ":")))
+
+    async def _listen(self):
+        """Dispatch events in the order the server delivers them"""
+        async for message in self._pubsub.listen():
+            message_type = message.get("type")
+            if message_type == "subscribe":
+                channel = message["channel"]
+                confirmation = self._confirmations.pop(
+                    channel.decode() if isinstance(channel, bytes) else channel, None
+                )
+                if confirmation is not None and not confirmation.done():
+                    confirmation.set_result(None)
+                continue
+            if message_type != "message":
+                continue
+            try:
+                await self._handler(json.loads(message["data"]))
+            except Exception as e:
+                print(f"Backplane event error: {e}")
+
+    async def stop(self):
+        """Unsubscribe and close the connection"""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.close()
+            self._pubsub = None
+        await self._redis.close()
+        for confirmation in self._confirmations.values():
+            confirmation.cancel()
+        self._confirmations.clear()
+        self.rooms.clear()
+        await super().stop()
+
+
+def create_backplane(url: str = BACKPLANE_URL) -> Backplane:
+    """Create the backplane selected by BACKPLANE_URL"""
+    if not url:
+        return InProcessBackplane()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackplane(url)
+    raise ValueError(f"Unsupported BACKPLANE_URL: {url}")
+
+
+# Global backplane instance
+backplane = create_backplane()
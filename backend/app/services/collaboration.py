@@ -0,0 +1,279 @@
+"""
+Room collaboration hub: applies edits and fan-out through the backplane
+"""
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+from app.services.backplane import NODE_ID, backplane
+from app.services.connection_manager import ClientConnection, build_snapshot_frame, manager
+from app.services.document_store import document_store
+from app.services.metrics import WS_RECEIVE_TO_BROADCAST_SECONDS
+from app.services.profiler import profiler
+from app.services.ot_service import OperationError, OTService, RoomDocument
+from app.services.wire_format import utc_timestamp
+
+# Seconds to wait for another process to share a room's live document
+BACKPLANE_SYNC_TIMEOUT = float(os.getenv("BACKPLANE_SYNC_TIMEOUT", "0.5"))
+
+
+class RoomSync:
+    """State of a room being synchronized from other processes"""
+
+    def __init__(self):
+        # Set once our own sync request came back through the backplane
+        self.requested = False
+        # Edits ordered after our request, applied once the sync completes
+        self.buffer: List[dict] = []
+        self.reply: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.done = asyncio.Event()
+
+
+class CollaborationHub:
+    """
+    Applies room events in backplane order
+
+    Edits and broadcasts are published to the backplane rather than applied
+    directly. Every process receives them in the same order and applies them
+    to its own copy of the room's document, then delivers them to its local
+    connections, so rooms stay consistent across workers and nodes.
+    """
+
+    def __init__(self):
+        self._syncing: Dict[str, RoomSync] = {}
+
+    async def start(self):
+        """Start receiving backplane events"""
+        await backplane.start(self.handle_event)
+
+    async def stop(self):
+        """Stop receiving backplane events"""
+        await backplane.stop()
+
+    async def join(self, room_id: str, document: RoomDocument):
+        """
+        Prepare a document acquired from the store for a new connection
+
+        When other processes may hold the room, a document this process is
+        not yet subscribed to (newly loaded) starts receiving the room's
+        events and is replaced with their live state before it is used.
+        """
+        sync = self._syncing.get(room_id)
+        if sync is not None:
+            await sync.done.wait()
+        elif backplane.distributed and not backplane.subscribed(room_id):
+            await self._sync(room_id, document)
+
+    async def submit_operation(self, client: ClientConnection, message: dict, received: Optional[float] = None):
+        """Publish a client's operations for ordered application"""
+        try:
+            ops = OTService.validate(message.get("ops"))
+            version = int(message.get("version", -1))
+        except (OperationError, TypeError, ValueError) as e:
+            self._reject(client, str(e))
+            return
+
+        await backplane.publish({
+            "kind": "operation",
+            "room": client.room_id,
+            "origin": NODE_ID,
+            "client": client.client_id,
+            "version": version,
+            "ops": ops,
+            "userId": message.get("userId"),
+            # Only meaningful to this process, which measures the latency
+            "received": received,
+            "sampled": profiler.active()
+        })
+
+    async def submit_code_update(self, client: ClientConnection, message: dict, received: Optional[float] = None):
+        """Publish a client's full-snapshot update for ordered application"""
+        await backplane.publish({
+            "kind": "code_update",
+            "room": client.room_id,
+            "origin": NODE_ID,
+            "client": client.client_id,
+            "code": message.get("code", ""),
+            "language": message.get("language", "python"),
+            "cursorPosition": message.get("cursorPosition"),
+            "userId": message.get("userId"),
+            "received": received,
+            "sampled": profiler.active()
+        })
+
+    async def broadcast(self, room_id: str, message: dict, exclude: Optional[ClientConnection] = None):
+        """Broadcast a message to a room's connections in every process"""
+        await backplane.publish({
+            "kind": "broadcast",
+            "room": room_id,
+            "origin": NODE_ID,
+            "exclude": exclude.client_id if exclude is not None else None,
+            "message": message
+        })
+
+    async def handle_event(self, event: dict):
+        """Handle an event delivered by the backplane"""
+        kind = event.get("kind")
+        room_id = event.get("room")
+
+        if kind == "broadcast":
+            await manager.broadcast(room_id, event["message"], exclude=self._local_client(event, "exclude"))
+
+        elif kind in ("operation", "code_update"):
+            sync = self._syncing.get(room_id)
+            if sync is not None:
+                # Edits ordered before our request are part of the sync reply
+                if sync.requested:
+                    sync.buffer.append(event)
+                return
+            await self._apply(event)
+
+        elif kind == "sync_request":
+            sync = self._syncing.get(room_id)
+            if event.get("origin") == NODE_ID:
+                if sync is not None:
+                    sync.requested = True
+            elif sync is None:
+                await self._reply_sync(room_id, event["origin"])
+
+        elif kind == "sync":
+            sync = self._syncing.get(room_id)
+            if event.get("target") == NODE_ID and sync is not None and not sync.reply.done():
+                sync.reply.set_result(event)
+
+    async def _apply(self, event: dict):
+        """Apply an ordered edit to the local document and fan it out"""
+        room_id = event["room"]
+        document = document_store.get(room_id)
+        if document is None:
+            # No local connections hold this room
+            return
+
+        # Timed if the message was sampled where it was received
+        with profiler.capturing(room_id), profiler.sampling(event.get("sampled", False)):
+            await self._apply_to(document, event)
+
+    async def _apply_to(self, document: RoomDocument, event: dict):
+        """Apply an ordered edit to a loaded document and fan it out"""
+        room_id = event["room"]
+        route = f"ws:{event['kind']}"
+        client = self._local_client(event, "client")
+        started = profiler.start()
+
+        if event["kind"] == "code_update":
+            # Recorded as the operations between the old and new document
+            ops = document.replace(event["code"], event["language"])
+        else:
+            try:
+                ops = document.apply_operation(
+                    event["version"], event["ops"], author=f"{event.get('origin')}:{event.get('client')}"
+                )
+            except OperationError as e:
+                if client is not None:
+                    self._reject(client, str(e))
+                return
+
+            if client is not None:
+                client.send({"type": "ack", "version": document.version})
+
+        document_store.mark_dirty(room_id)
+        profiler.record(route, "apply", started)
+
+        timestamp = utc_timestamp()
+        message = {
+            "type": "operation",
+            "version": document.version,
+            "ops": ops,
+            "userId": event.get("userId"),
+            "timestamp": timestamp
+        }
+        if event["kind"] == "code_update":
+            # Snapshot updates may also switch the language
+            message["language"] = document.language
+
+        started = profiler.start()
+        await manager.broadcast(
+            room_id,
+            message,
+            exclude=client,
+            snapshot_message={
+                "type": "code_update",
+                "code": document.code,
+                "version": document.version,
+                "cursorPosition": event.get("cursorPosition"),
+                "userId": event.get("userId"),
+                "timestamp": timestamp
+            }
+        )
+        profiler.record(route, "broadcast", started)
+
+        received = event.get("received")
+        if received is not None and event.get("origin") == NODE_ID:
+            WS_RECEIVE_TO_BROADCAST_SECONDS.observe(time.perf_counter() - received, (event["kind"],))
+
+    def _reject(self, client: ClientConnection, error: str):
+        """Report a failed edit and let the client resynchronize"""
+        client.send({"type": "error", "message": error})
+        snapshot = build_snapshot_frame(client.room_id, "ot")
+        if snapshot is not None:
+            client.send(snapshot)
+
+    def _local_client(self, event: dict, key: str) -> Optional[ClientConnection]:
+        """Find the connection an event refers to if it lives in this process"""
+        if event.get("origin") != NODE_ID or event.get(key) is None:
+            return None
+        return manager.clients.get(event[key])
+
+    async def _sync(self, room_id: str, document: RoomDocument):
+        """Replace a newly loaded document with the live state held elsewhere"""
+        sync = RoomSync()
+        self._syncing[room_id] = sync
+
+        try:
+            # Events published from here on reach us, starting with our request
+            await backplane.subscribe(room_id)
+            await backplane.publish({"kind": "sync_request", "room": room_id, "origin": NODE_ID})
+
+            try:
+                reply = await asyncio.wait_for(asyncio.shield(sync.reply), BACKPLANE_SYNC_TIMEOUT)
+            except asyncio.TimeoutError:
+                # Nobody else holds the room; the stored copy is current
+                reply = None
+
+            if reply is not None:
+                document.code = reply["code"]
+                document.language = reply["language"]
+                document.version = reply["version"]
+                document.epoch = reply["epoch"]
+                document.history.clear()
+                document.history.extend((version, ops) for version, ops in reply["history"])
+
+            del self._syncing[room_id]
+            for event in sync.buffer:
+                await self._apply(event)
+        finally:
+            self._syncing.pop(room_id, None)
+            sync.done.set()
+
+    async def _reply_sync(self, room_id: str, target: str):
+        """Share this process's live document with a process that just loaded it"""
+        document = document_store.get(room_id)
+        if document is None:
+            return
+
+        await backplane.publish({
+            "kind": "sync",
+            "room": room_id,
+            "origin": NODE_ID,
+            "target": target,
+            "code": document.code,
+            "language": document.language,
+            "version": document.version,
+            "epoch": document.epoch,
+            # Lets the new process transform edits made against older versions
+            "history": list(document.history)
+        })
+
+
+# Global collaboration hub instance
+hub = CollaborationHub()
@@ -0,0 +1,397 @@
+"""
+WebSocket connection management with per-connection outbound queues
+"""
+import asyncio
+import os
+import uuid
+import weakref
+from collections import deque
+from typing import Deque, Dict, List, Optional, Set, Tuple, Union
+from fastapi import WebSocket
+from app.services.document_store import document_store
+from app.services.ot_service import RoomDocument
+from app.services.metrics import BROADCAST_FANOUT, SLOW_CLIENT_DISCONNECTS, metrics
+from app.services.profiler import profiler
+from app.services.spectators import spectator_fanout
+from app.services.wire_format import Frame, send_frame
+
+# Maximum number of messages waiting to be written to one client
+OUTBOUND_QUEUE_SIZE = int(os.getenv("OUTBOUND_QUEUE_SIZE", "256"))
+
+# What to do when a client's queue is full: "drop_cursor", "collapse" or "disconnect"
+OUTBOUND_OVERFLOW_POLICY = os.getenv("OUTBOUND_OVERFLOW_POLICY", "drop_cursor")
+
+# Close code sent to clients that cannot keep up (1013: try again later)
+SLOW_CLIENT_CLOSE_CODE = 1013
+
+# Longest userId kept for a connection
+USER_ID_MAX_LENGTH = 64
+
+# Message types that only carry transient cursor positions
+CURSOR_MESSAGE_TYPES = {"cursor_move", "cursors"}
+
+# Message types that change the document and are superseded by a snapshot
+DOCUMENT_MESSAGE_TYPES = {"code_update", "operation", "snapshot", "changes"}
+
+
+# document -> (version, protocol -> frame) of its latest snapshot frames
+_snapshot_frames: "weakref.WeakKeyDictionary[RoomDocument, Tuple[int, Dict[str, Frame]]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def build_snapshot_frame(room_id: str, protocol: str) -> Optional[Frame]:
+    """
+    Get a full-document frame for a room in the client's protocol
+
+    Every client that needs the current version's snapshot gets the same
+    frame, so the document is encoded once per wire format however many
+    clients collapse or resynchronize at that version.
+    """
+    document = document_store.get(room_id)
+    if document is None:
+        return None
+
+    cached = _snapshot_frames.get(document)
+    if cached is None or cached[0] != document.version:
+        cached = (document.version, {})
+        _snapshot_frames[document] = cached
+
+    frame = cached[1].get(protocol)
+    if frame is None:
+        frame = Frame({
+            "type": "snapshot" if protocol == "ot" else "code_update",
+            "code": document.code,
+            "language": document.language,
+            "version": document.version
+        })
+        cached[1][protocol] = frame
+    return frame
+
+
+class ClientConnection:
+    """
+    A WebSocket connection with a bounded outbound queue and writer task
+
+    Messages are queued without waiting for the network, so one slow client
+    never delays the sender or the rest of the room. Frames are shared with
+    the other recipients and written in the client's wire format.
+    """
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        protocol: str = "snapshot",
+        encoding: str = "json",
+        queue_size: int = OUTBOUND_QUEUE_SIZE,
+        overflow_policy: str = OUTBOUND_OVERFLOW_POLICY,
+        spectator: bool = False,
+        user_id: Optional[str] = None
+    ):
+        self.websocket = websocket
+        # Identifies the connection when the client does not send a userId
+        self.client_id = uuid.uuid4().hex[:8]
+        # The user shown in the room's roster
+        self.user_id = user_id[:USER_ID_MAX_LENGTH] if user_id else self.client_id
+        self.room_id = room_id
+        self.protocol = protocol
+        self.encoding = encoding
+        # Read-only connections served by the spectator fan-out
+        self.spectator = spectator
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.queue: Deque[Frame] = deque()
+        self.dropped = 0
+        self.closed = False
+        self._close_code: Optional[int] = None
+        self._wakeup = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the writer task"""
+        self._writer = asyncio.create_task(self._write_loop())
+
+    async def stop(self):
+        """Stop the writer task, discarding anything still queued"""
+        self.closed = True
+        self.queue.clear()
+        if self._writer is not None:
+            self._writer.cancel()
+            try:
+                await self._writer
+            except asyncio.CancelledError:
+                pass
+            self._writer = None
+
+    def send(self, message: Union[Frame, dict]) -> bool:
+        """
+        Queue a message for this client without waiting for the network
+
+        Args:
+            message: The frame (or a message for this client only) to send
+
+        Returns:
+            False if the message could not be queued and the client is being
+            disconnected, True otherwise
+        """
+        if self.closed or self._close_code is not None:
+            return False
+
+        frame = message if isinstance(message, Frame) else Frame(message)
+
+        if len(self.queue) >= self.queue_size and not self._make_room(frame):
+            self.dropped += 1
+            if self._close_code is not None:
+                return False
+            return True
+
+        self.queue.append(frame)
+        self._wakeup.set()
+        return True
+
+    def _make_room(self, frame: Frame) -> bool:
+        """
+        Apply the overflow policy to a full queue
+
+        Returns:
+            True if `frame` should still be queued
+        """
+        if self.overflow_policy == "drop_cursor":
+            # Intermediate cursor positions are superseded by the newest ones
+            if self._merge_cursors(frame):
+                return False
+            if len(self.queue) < self.queue_size:
+                return True
+            if frame.type in CURSOR_MESSAGE_TYPES:
+                # Never worth a disconnect: skip this position
+                return False
+
+        elif self.overflow_policy == "collapse":
+            # Replace every queued document change with one current snapshot
+            merged = self._merge_cursors(frame)
+            self._discard(DOCUMENT_MESSAGE_TYPES)
+            snapshot = build_snapshot_frame(self.room_id, self.protocol)
+            if snapshot is not None and len(self.queue) < self.queue_size:
+                self.queue.append(snapshot)
+                self._wakeup.set()
+            if merged or frame.type in DOCUMENT_MESSAGE_TYPES:
+                # Already covered by the merged cursors or the snapshot
+                return False
+            if len(self.queue) < self.queue_size:
+                return True
+
+        SLOW_CLIENT_DISCONNECTS.inc()
+        self._request_close(SLOW_CLIENT_CLOSE_CODE)
+        return False
+
+    def _merge_cursors(self, frame: Frame) -> bool:
+        """
+        Merge the queued cursor messages into one with each user's newest position
+
+        A `cursors` message only lists the users that moved during its tick,
+        so the merged message keeps everyone's latest entry. It takes the
+        place of the newest message it replaces, which is `frame` itself when
+        that is a cursor message too.
+
+        Returns:
+            True if `frame` was merged and must not be queued
+        """
+        incoming = frame.type in CURSOR_MESSAGE_TYPES
+        cursor_frames = [queued for queued in self.queue if queued.type in CURSOR_MESSAGE_TYPES]
+        if incoming:
+            cursor_frames.append(frame)
+        if len(cursor_frames) < 2:
+            # Nothing to merge
+            return False
+
+        latest: Dict[str, dict] = {}
+        for cursor_frame in cursor_frames:
+            message = cursor_frame.message
+            if cursor_frame.type == "cursors":
+                entries = message.get("cursors") or []
+            else:
+                entries = [{"userId": message.get("userId"), "cursorPosition": message.get("cursorPosition")}]
+            for entry in entries:
+                latest[entry.get("userId")] = entry
+
+        newest = cursor_frames[-1]
+        merged = Frame({
+            "type": "cursors",
+            "cursors": list(latest.values()),
+            "timestamp": newest.message.get("timestamp")
+        })
+        self.queue = deque(
+            merged if queued is newest else queued
+            for queued in self.queue
+            if queued is newest or queued.type not in CURSOR_MESSAGE_TYPES
+        )
+        if incoming:
+            self.queue.append(merged)
+            self._wakeup.set()
+        return incoming
+
+    def _discard(self, message_types: Set[str]):
+        """Remove queued messages of the given types"""
+        self.queue = deque(f for f in self.queue if f.type not in message_types)
+
+    def _request_close(self, code: int):
+        """Ask the writer task to drop the queue and close the socket"""
+        self._close_code = code
+        self.queue.clear()
+        self._wakeup.set()
+
+    async def _write_loop(self):
+        """Write queued messages to the socket in order"""
+        try:
+            while True:
+                while not self.queue and self._close_code is None:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+
+                if self._close_code is not None:
+                    await self.websocket.close(code=self._close_code, reason="Client too slow")
+                    return
+
+                frame = self.queue.popleft()
+                started = profiler.start(frame.sampled)
+                with profiler.capturing(self.room_id):
+                    await send_frame(self.websocket, frame, self.encoding)
+                # Encoding (usually cached) plus the socket write
+                profiler.record(f"ws:{frame.type}", "send", started)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # The receive loop notices the broken socket and cleans up
+            pass
+        finally:
+            self.closed = True
+
+
+class ConnectionManager:
+    """Manages WebSocket connections for each room"""
+
+    def __init__(self):
+        # Dictionary mapping room_id to set of active connections
+        self.active_connections: Dict[str, Set[ClientConnection]] = {}
+        # Dictionary mapping client_id to connection
+        self.clients: Dict[str, ClientConnection] = {}
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_id: str,
+        protocol: str = "snapshot",
+        encoding: str = "json",
+        spectator: bool = False,
+        user_id: Optional[str] = None
+    ) -> ClientConnection:
+        """Accept and register a new WebSocket connection"""
+        await websocket.accept()
+
+        if spectator:
+            # A spectator that falls behind only needs the current document
+            client = ClientConnection(
+                websocket, room_id, protocol, encoding, overflow_policy="collapse",
+                spectator=True, user_id=user_id
+            )
+            client.start()
+            spectator_fanout.add(client)
+            return client
+
+        client = ClientConnection(websocket, room_id, protocol, encoding, user_id=user_id)
+        client.start()
+
+        if room_id not in self.active_connections:
+            self.active_connections[room_id] = set()
+
+        self.active_connections[room_id].add(client)
+        self.clients[client.client_id] = client
+
+        return client
+
+    async def disconnect(self, client: ClientConnection):
+        """Remove a connection and stop its writer"""
+        if client.spectator:
+            spectator_fanout.remove(client)
+            await client.stop()
+            return
+
+        room_id = client.room_id
+        self.clients.pop(client.client_id, None)
+
+        if room_id in self.active_connections:
+            self.active_connections[room_id].discard(client)
+
+            # Clean up empty rooms
+            if not self.active_connections[room_id]:
+                del self.active_connections[room_id]
+
+        await client.stop()
+
+    async def broadcast(
+        self,
+        room_id: str,
+        message: dict,
+        exclude: ClientConnection = None,
+        snapshot_message: Optional[dict] = None
+    ):
+        """
+        Broadcast a message to all connections in a room
+
+        Each message is wrapped in one shared Frame, so it is encoded once
+        per wire format rather than once per recipient. Frames are queued on
+        each connection, so this never waits on a slow client. The room's
+        spectators are handed the same frames by the spectator fan-out.
+
+        Args:
+            room_id: The room to broadcast to
+            message: The message to send
+            exclude: Optional connection to exclude from broadcast (e.g., sender)
+            snapshot_message: Optional full-snapshot variant sent to clients
+                that do not speak the operation-based protocol
+        """
+        connections = self.active_connections.get(room_id)
+        if not connections and room_id not in spectator_fanout.rooms:
+            return
+
+        frame = Frame(message)
+        snapshot_frame = Frame(snapshot_message) if snapshot_message is not None else frame
+
+        if connections:
+            BROADCAST_FANOUT.observe(len(connections) - (exclude in connections))
+
+            for client in connections:
+                if client is exclude:
+                    continue
+
+                client.send(frame if client.protocol == "ot" else snapshot_frame)
+
+        spectator_fanout.publish(room_id, frame, snapshot_frame)
+
+    def get_connection_count(self, room_id: str) -> int:
+        """Get number of active connections in a room, spectators excluded"""
+        return len(self.active_connections.get(room_id, set()))
+
+    def get_roster(self, room_id: str) -> List[str]:
+        """Get the distinct users connected to a room, spectators excluded"""
+        return sorted({client.user_id for client in self.active_connections.get(room_id, ())})
+
+    def get_spectator_count(self, room_id: str) -> int:
+        """Get number of spectators in a room"""
+        return spectator_fanout.count(room_id)
+
+
+# Global connection manager instance
+manager = ConnectionManager()
+
+metrics.gauge(
+    "pairprog_active_rooms",
+    "Rooms with WebSocket connections in this process",
+    lambda: len(manager.active_connections)
+)
+metrics.gauge(
+    "pairprog_active_connections",
+    "WebSocket connections in this process",
+    lambda: len(manager.clients)
+)
@@ -0,0 +1,266 @@
+"""
+In-memory room document store with write-behind persistence
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Set
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import SessionLocal
+from app.services.backplane import backplane
+from app.services.metrics import metrics
+from app.services.profiler import profiler
+from app.services.ot_service import RoomDocument
+from app.services.room_service import DocumentUpdate, RoomService
+
+# Seconds between batched flushes of dirty rooms to the database
+DOCUMENT_FLUSH_INTERVAL = float(os.getenv("DOCUMENT_FLUSH_INTERVAL", "2.0"))
+
+# Seconds a room's document stays loaded after its last connection leaves (0: unload at once)
+ROOM_IDLE_TTL = float(os.getenv("ROOM_IDLE_TTL", "120"))
+
+
+class DocumentStore:
+    """
+    Authoritative documents for rooms with live connections
+
+    Edits are applied in memory and the room is marked dirty. A background
+    task writes all dirty rooms in one commit every `flush_interval` seconds,
+    so database writes follow the number of active rooms rather than the
+    number of keystrokes.
+
+    A document stays loaded for `idle_ttl` seconds after its last connection
+    leaves, so clients reconnecting within that window resume from memory
+    (and can resync from the edit log) instead of reloading the room.
+    `evict_idle` unloads documents once they have been idle longer.
+    """
+
+    def __init__(self, flush_interval: float = DOCUMENT_FLUSH_INTERVAL, idle_ttl: float = ROOM_IDLE_TTL):
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.documents: Dict[str, RoomDocument] = {}
+        self.dirty: Set[str] = set()
+        # Number of live connections holding each document
+        self.holders: Dict[str, int] = {}
+        # Monotonic time each loaded document without holders was released
+        self.idle_since: Dict[str, float] = {}
+        # Flush currently writing each room, resolved once it finished
+        self.flushing: Dict[str, asyncio.Future] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def get(self, room_id: str) -> Optional[RoomDocument]:
+        """Get the live document for a room, if it is loaded"""
+        return self.documents.get(room_id)
+
+    async def acquire(self, db: AsyncSession, room_id: str) -> RoomDocument:
+        """Get the live document for a room, loading it from the database"""
+        self.holders[room_id] = self.holders.get(room_id, 0) + 1
+        self.idle_since.pop(room_id, None)
+        document = self.documents.get(room_id)
+
+        if document is None:
+            try:
+                # Other processes write rooms without updating our cache
+                snapshot = await RoomService.get_room_snapshot(db, room_id, cached=not backplane.distributed)
+            except Exception:
+                self.holders[room_id] -= 1
+                raise
+            # Another connection may have loaded the room while we waited
+            document = self.documents.setdefault(room_id, RoomDocument(
+                code=snapshot.code if snapshot else "",
+                language=snapshot.language if snapshot else "python",
+                version=snapshot.version if snapshot else 0,
+                stored_epoch=snapshot.epoch if snapshot else None
+            ))
+
+        return document
+
+    def mark_dirty(self, room_id: str):
+        """Record that a room's document changed since the last flush"""
+        self.dirty.add(room_id)
+
+    async def flush(self, room_ids: Optional[Set[str]] = None) -> int:
+        """
+        Write dirty documents to the database in a single commit
+
+        Saves of the same room never overlap: flushes already writing one of
+        the rooms are waited for first, so when this returns every edit made
+        to the rooms before the call has been committed (or the flush raised).
+
+        Args:
+            room_ids: Rooms to flush; defaults to every dirty room
+
+        Returns:
+            Number of rooms written
+        """
+        # An older save committing after a newer one would move the stored
+        # version back, so wait until no flush is writing these rooms
+        while True:
+            candidates = self.dirty if room_ids is None else room_ids
+            in_flight = {self.flushing[room_id] for room_id in candidates if room_id in self.flushing}
+            if not in_flight:
+                break
+            await asyncio.wait(in_flight)
+
+        pending = self.dirty if room_ids is None else self.dirty & set(room_ids)
+        if not pending:
+            return 0
+
+        self.dirty = self.dirty - pending
+        done = asyncio.get_running_loop().create_future()
+        for room_id in pending:
+            self.flushing[room_id] = done
+
+        try:
+            return await self._write(pending)
+        finally:
+            for room_id in pending:
+                if self.flushing.get(room_id) is done:
+                    del self.flushing[room_id]
+            done.set_result(None)
+
+    async def _write(self, pending: Set[str]) -> int:
+        """Save the documents of rooms taken out of `dirty` by `flush`"""
+        updates = {}
+        documents = {}
+        for room_id in pending:
+            document = self.documents.get(room_id)
+            if document is not None:
+                documents[room_id] = document
+                # Only the edits since the last save are written
+                updates[room_id] = DocumentUpdate(
+                    document.code,
+                    document.language,
+                    document.version,
+                    document.epoch,
+                    document.history.since(document.saved_version, document.version)
+                )
+
+        started = profiler.start(profiler.sampled())
+        try:
+            async with SessionLocal() as db:
+                await RoomService.save_code_states(db, updates)
+        except BaseException:
+            # Keep the rooms dirty so the next flush retries them, also when
+            # the flush was cancelled (e.g. the flusher stopping mid-write)
+            self.dirty |= pending
+            raise
+        profiler.record("flush", "persist", started)
+
+        for room_id, update in updates.items():
+            document = documents[room_id]
+            document.saved_version = max(document.saved_version, update.version)
+
+        return len(updates)
+
+    async def release(self, room_id: str):
+        """Drop a connection's hold; flush after the last one leaves"""
+        self.holders[room_id] = self.holders.get(room_id, 1) - 1
+        if self.holders[room_id] > 0:
+            return
+
+        try:
+            await self.flush({room_id})
+        except Exception as e:
+            # The room stays dirty; the background flusher retries it
+            print(f"Document flush error: {e}")
+
+        # Only unload if nobody re-acquired the room during the flush
+        if self.holders.get(room_id, 0) > 0:
+            return
+
+        if self.idle_ttl > 0 or room_id in self.dirty:
+            # Unloaded by evict_idle once its edits are saved
+            self.idle_since[room_id] = time.monotonic()
+        else:
+            await self._unload(room_id)
+
+    async def evict_idle(self, now: Optional[float] = None) -> int:
+        """
+        Flush and unload documents that have had no connections for `idle_ttl`
+
+        Args:
+            now: Current monotonic time; defaults to the clock
+
+        Returns:
+            Number of documents unloaded
+        """
+        now = time.monotonic() if now is None else now
+        expired = {room_id for room_id, since in self.idle_since.items() if now - since >= self.idle_ttl}
+        if not expired:
+            return 0
+
+        await self.flush(expired)
+
+        evicted = 0
+        for room_id in expired:
+            since = self.idle_since.get(room_id)
+            # Re-acquired, or edited through the backplane, during the flush
+            if since is None or now - since < self.idle_ttl or room_id in self.dirty:
+                continue
+            await self._unload(room_id)
+            evicted += 1
+
+        return evicted
+
+    async def _unload(self, room_id: str):
+        """Forget a room's document and stop receiving its events"""
+        self.holders.pop(room_id, None)
+        self.idle_since.pop(room_id, None)
+        self.documents.pop(room_id, None)
+        await backplane.unsubscribe(room_id)
+
+    def stats(self) -> Dict:
+        """Loaded, idle and unsaved document counts"""
+        return {
+            "loaded": len(self.documents),
+            "idle": len(self.idle_since),
+            "dirty": len(self.dirty),
+            "idleTtlSeconds": self.idle_ttl
+        }
+
+    async def _flush_loop(self):
+        """Periodically flush dirty rooms until cancelled"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Document flush error: {e}")
+
+    def start(self):
+        """Start the background flusher"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the background flusher and write any remaining changes"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+
+        await self.flush()
+
+
+# Global document store instance
+document_store = DocumentStore()
+
+metrics.gauge(
+    "pairprog_documents_loaded",
+    "Room documents held in memory, including idle ones",
+    lambda: len(document_store.documents)
+)
+metrics.gauge(
+    "pairprog_documents_dirty",
+    "Room documents with edits not yet written to the database",
+    lambda: len(document_store.dirty)
+)
+metrics.gauge(
+    "pairprog_documents_idle",
+    "Room documents without connections, waiting to be evicted",
+    lambda: len(document_store.idle_since)
+)
@@ -0,0 +1,99 @@
+"""
+Bounded, versioned log of a room's recent edits
+"""
+import os
+from collections import deque
+from itertools import islice
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+# Edits kept per room for transforming late operations and resyncing clients
+EDIT_LOG_LIMIT = int(os.getenv("EDIT_LOG_LIMIT", "500"))
+
+# Characters of inserted text kept per room before the oldest edits are dropped
+EDIT_LOG_MAX_CHARS = int(os.getenv("EDIT_LOG_MAX_CHARS", "262144"))
+
+Entry = Tuple[int, List[Dict]]
+
+
+def _entry_size(ops: List[Dict]) -> int:
+    """Approximate wire size of an edit, in characters"""
+    return sum(len(op["text"]) if op["type"] == "insert" else 1 for op in ops) + 1
+
+
+class EditLog:
+    """
+    The operations that produced each of a document's recent versions
+
+    Entries are (version produced, ops) with consecutive versions. The log is
+    compacted from the oldest end once it holds more than `limit` edits or
+    more than `max_chars` characters of edits. Versions older than the first
+    entry can only be caught up with a snapshot of the document.
+    """
+
+    def __init__(self, limit: int = EDIT_LOG_LIMIT, max_chars: int = EDIT_LOG_MAX_CHARS):
+        self.limit = limit
+        self.max_chars = max_chars
+        self._entries: Deque[Entry] = deque()
+        self._sizes: Deque[int] = deque()
+        self.chars = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Entry]:
+        return iter(self._entries)
+
+    def append(self, version: int, ops: List[Dict]):
+        """Record the operations that produced `version`, compacting if needed"""
+        size = _entry_size(ops)
+        self._entries.append((version, ops))
+        self._sizes.append(size)
+        self.chars += size
+
+        while len(self._entries) > self.limit or (self.chars > self.max_chars and len(self._entries) > 1):
+            self._entries.popleft()
+            self.chars -= self._sizes.popleft()
+
+    def extend(self, entries: List[Entry]):
+        """Record several edits in version order"""
+        for version, ops in entries:
+            self.append(version, ops)
+
+    def clear(self):
+        """Drop every edit"""
+        self._entries.clear()
+        self._sizes.clear()
+        self.chars = 0
+
+    def last(self, count: int) -> List[Entry]:
+        """The most recent `count` edits, oldest first"""
+        if count <= 0:
+            return []
+        return list(islice(reversed(self._entries), count))[::-1]
+
+    def since(self, version: int, current_version: int, max_chars: Optional[int] = None) -> Optional[List[Entry]]:
+        """
+        The edits a client at `version` is missing
+
+        Args:
+            version: Version the client has
+            current_version: Version of the document
+            max_chars: Give up when the edits are larger than this, e.g. when
+                the document itself would be cheaper to send
+
+        Returns:
+            The missing edits, oldest first, or None if they have been
+            compacted away or exceed `max_chars`
+        """
+        missed = current_version - version
+        if missed < 0 or missed > len(self._entries):
+            return None
+
+        if max_chars is not None:
+            size = 0
+            for index in range(len(self._sizes) - 1, len(self._sizes) - 1 - missed, -1):
+                size += self._sizes[index]
+                if size > max_chars:
+                    return None
+
+        return self.last(missed)
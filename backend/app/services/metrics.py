@@ -0,0 +1,250 @@
+"""
+In-process metrics, exposed in the Prometheus text format
+"""
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Union
+
+# Latency histogram bounds, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Broadcast recipient histogram bounds
+FANOUT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Escape a label value"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    """Render a label set, e.g. {type="operation",le="0.1"}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value"""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """A monotonically increasing count per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        """Add to the count"""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        """Sample lines"""
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge:
+    """A value read from the application when metrics are collected"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        read: Callable[[], Union[float, Dict[Labels, float]]],
+        labelnames: Sequence[str] = ()
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.read = read
+
+    def render(self) -> List[str]:
+        """Sample lines"""
+        value = self.read()
+        values = value if isinstance(value, dict) else {(): value}
+        return [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(sample)}"
+            for labels, sample in values.items()
+        ]
+
+
+class _HistogramSeries:
+    """Bucket counts of one label set"""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, size: int):
+        # One count per bound plus the +Inf bucket, not cumulative
+        self.counts = [0] * (size + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram:
+    """
+    Distribution of observed values per label set
+
+    Observing a value is one bisect and three additions, so histograms can be
+    recorded on every message without measurable overhead. Buckets are made
+    cumulative only when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, _HistogramSeries] = {}
+
+    def observe(self, value: float, labels: Labels = ()):
+        """Record one value"""
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _HistogramSeries(len(self.buckets))
+        series.counts[bisect_left(self.buckets, value)] += 1
+        series.sum += value
+        series.count += 1
+
+    @contextmanager
+    def time(self, labels: Labels = ()) -> Iterator[None]:
+        """Record the duration of a block, in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, labels)
+
+    def render(self) -> List[str]:
+        """Sample lines"""
+        lines = []
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series.counts):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series.sum)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {series.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """The application's metrics, rendered together for scraping"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Union[Counter, Gauge, Histogram]] = {}
+
+    def _register(self, metric):
+        """Add a metric, rejecting duplicate names"""
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Register a counter"""
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        read: Callable[[], Union[float, Dict[Labels, float]]],
+        labelnames: Sequence[str] = ()
+    ) -> Gauge:
+        """Register a gauge read by `read` at collection time"""
+        return self._register(Gauge(name, help_text, read, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Register a histogram"""
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics.values():
+            try:
+                samples = metric.render()
+            except Exception as e:
+                # One failing gauge must not hide every other metric
+                print(f"Metrics collection error ({metric.name}): {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# Global metrics registry instance
+metrics = MetricsRegistry()
+
+# Metrics recorded across modules; gauges are registered next to the state they read
+WS_RECEIVE_TO_BROADCAST_SECONDS = metrics.histogram(
+    "pairprog_ws_receive_to_broadcast_seconds",
+    "Time from receiving a WebSocket message to queuing its result for the room",
+    ("type",)
+)
+BROADCAST_FANOUT = metrics.histogram(
+    "pairprog_broadcast_fanout",
+    "Connections a room broadcast is queued for",
+    buckets=FANOUT_BUCKETS
+)
+DB_QUERY_SECONDS = metrics.histogram(
+    "pairprog_db_query_seconds",
+    "Database statement execution time",
+    ("statement",)
+)
+DB_COMMIT_SECONDS = metrics.histogram(
+    "pairprog_db_commit_seconds",
+    "RoomService commit time",
+    ("operation",)
+)
+DB_POOL_WAIT_SECONDS = metrics.histogram(
+    "pairprog_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled database connection"
+)
+SLOW_CLIENT_DISCONNECTS = metrics.counter(
+    "pairprog_slow_client_disconnects_total",
+    "Connections closed because their outbound queue overflowed"
+)
+AUTOCOMPLETE_SECONDS = metrics.histogram(
+    "pairprog_autocomplete_seconds",
+    "Autocomplete request latency by outcome",
+    ("outcome",)
+)
+STAGE_SECONDS = metrics.histogram(
+    "pairprog_stage_seconds",
+    "Sampled time per handling stage of WebSocket messages, REST requests and flushes",
+    ("route", "stage")
+)
@@ -0,0 +1,310 @@
+"""
+Operational transformation service for delta-based code updates
+"""
+import uuid
+from typing import Dict, List, Optional, Tuple
+from app.services.edit_log import EditLog, Entry
+from app.services.symbol_index import SymbolIndex
+from app.services.text_diff import diff_operations
+
+
+class OperationError(ValueError):
+    """Raised when an operation cannot be applied to a document"""
+    pass
+
+
+class OTService:
+    """
+    Service for applying and transforming text operations
+
+    An operation is a dict in one of two shapes:
+        {"type": "insert", "position": int, "text": str}
+        {"type": "delete", "position": int, "length": int}
+
+    Messages carry a list of operations that are applied one after another.
+    """
+
+    @staticmethod
+    def validate(ops: List[Dict]) -> List[Dict]:
+        """Normalize a list of raw operations, raising OperationError if malformed"""
+        if not isinstance(ops, list):
+            raise OperationError("ops must be a list")
+
+        normalized = []
+        for op in ops:
+            if not isinstance(op, dict):
+                raise OperationError("operation must be an object")
+
+            position = op.get("position")
+            if not isinstance(position, int) or isinstance(position, bool) or position < 0:
+                raise OperationError("operation position must be a non-negative integer")
+
+            if op.get("type") == "insert":
+                text = op.get("text")
+                if not isinstance(text, str):
+                    raise OperationError("insert text must be a string")
+                if text:
+                    normalized.append({"type": "insert", "position": position, "text": text})
+            elif op.get("type") == "delete":
+                length = op.get("length")
+                if not isinstance(length, int) or isinstance(length, bool) or length < 0:
+                    raise OperationError("delete length must be a non-negative integer")
+                if length:
+                    normalized.append({"type": "delete", "position": position, "length": length})
+            else:
+                raise OperationError(f"unknown operation type: {op.get('type')}")
+
+        return normalized
+
+    @staticmethod
+    def apply(code: str, ops: List[Dict]) -> str:
+        """
+        Apply operations to a document
+
+        Args:
+            code: Document the operations were made against
+            ops: Normalized operations
+
+        Returns:
+            The resulting document
+        """
+        for op in ops:
+            position = op["position"]
+
+            if op["type"] == "insert":
+                if position > len(code):
+                    raise OperationError("insert position out of range")
+                code = code[:position] + op["text"] + code[position:]
+            else:
+                if position + op["length"] > len(code):
+                    raise OperationError("delete range out of range")
+                code = code[:position] + code[position + op["length"]:]
+
+        return code
+
+    @staticmethod
+    def transform(ops: List[Dict], against: List[Dict]) -> List[Dict]:
+        """
+        Transform operations so they apply after `against` has been applied
+
+        Both lists must have been made against the same document. When two
+        inserts land on the same position, `against` (already applied on the
+        server) goes first.
+        """
+        transformed, _ = OTService._transform_lists(ops, against)
+        return transformed
+
+    @staticmethod
+    def _transform_lists(a_ops: List[Dict], b_ops: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Transform two concurrent operation lists against each other"""
+        if not a_ops or not b_ops:
+            return a_ops, b_ops
+
+        if len(a_ops) == 1 and len(b_ops) == 1:
+            return (
+                OTService._transform_op(a_ops[0], b_ops[0], other_first=True),
+                OTService._transform_op(b_ops[0], a_ops[0], other_first=False),
+            )
+
+        if len(a_ops) > 1:
+            head, b_ops = OTService._transform_lists(a_ops[:1], b_ops)
+            tail, b_ops = OTService._transform_lists(a_ops[1:], b_ops)
+            return head + tail, b_ops
+
+        a_ops, head = OTService._transform_lists(a_ops, b_ops[:1])
+        a_ops, tail = OTService._transform_lists(a_ops, b_ops[1:])
+        return a_ops, head + tail
+
+    @staticmethod
+    def _transform_op(op: Dict, other: Dict, other_first: bool) -> List[Dict]:
+        """Transform a single operation against a concurrent one"""
+        position = op["position"]
+        other_position = other["position"]
+
+        if op["type"] == "insert":
+            if other["type"] == "insert":
+                if other_position < position or (other_position == position and other_first):
+                    position += len(other["text"])
+            else:
+                other_end = other_position + other["length"]
+                if position >= other_end:
+                    position -= other["length"]
+                elif position > other_position:
+                    position = other_position
+            return [{"type": "insert", "position": position, "text": op["text"]}]
+
+        length = op["length"]
+        end = position + length
+
+        if other["type"] == "insert":
+            inserted = len(other["text"])
+            if other_position <= position:
+                return [{"type": "delete", "position": position + inserted, "length": length}]
+            if other_position >= end:
+                return [op]
+            # The insert landed inside the deleted range: keep it and delete around it
+            before = other_position - position
+            return [
+                {"type": "delete", "position": position, "length": before},
+                {"type": "delete", "position": position + inserted, "length": length - before},
+            ]
+
+        other_end = other_position + other["length"]
+        if end <= other_position:
+            return [op]
+        if position >= other_end:
+            return [{"type": "delete", "position": position - other["length"], "length": length}]
+
+        overlap = min(end, other_end) - max(position, other_position)
+        if length == overlap:
+            return []
+        return [{"type": "delete", "position": min(position, other_position), "length": length - overlap}]
+
+
+class RoomDocument:
+    """
+    Versioned in-memory document for a room
+
+    Versions continue from the stored version when a room is loaded. Each
+    load starts a new epoch, so a version number only identifies a document
+    state together with its epoch; the stored epoch and version identify the
+    state the document was loaded from.
+    """
+
+    def __init__(
+        self,
+        code: str = "",
+        language: str = "python",
+        version: int = 0,
+        stored_epoch: Optional[str] = None
+    ):
+        self.code = code
+        self.language = language
+        self.version = version
+        self.epoch = uuid.uuid4().hex[:12]
+        self.stored_epoch = stored_epoch
+        self.stored_version = version
+        # Latest version written to the database by this process
+        self.saved_version = version
+        # (version produced, ops) for the most recent edits
+        self.history = EditLog()
+        # Names defined in the document, brought up to date when suggesting
+        self.symbols = SymbolIndex()
+        # author -> version produced by the author's latest operation
+        self.author_versions: Dict[str, int] = {}
+
+    def apply_operation(self, base_version: int, ops: List[Dict], author: Optional[str] = None) -> List[Dict]:
+        """
+        Transform operations made at `base_version` and apply them
+
+        Operations are only transformed against other authors' edits, so an
+        author may have one operation in flight at a time: the next one must
+        be made at or after the version acknowledged for the previous one.
+
+        Args:
+            base_version: Document version the client edited
+            ops: Normalized operations
+            author: Identifies the sending client, to enforce one operation
+                in flight per author
+
+        Returns:
+            The transformed operations as applied to the current version
+        """
+        if base_version > self.version:
+            raise OperationError("operation is ahead of the server document")
+
+        if author is not None and base_version < self.author_versions.get(author, base_version):
+            # Made without seeing the ack of the author's previous operation,
+            # so it would be transformed against the author's own edit
+            raise OperationError(
+                "operation was made before the previous operation was acknowledged; "
+                "send one operation at a time"
+            )
+
+        missed = self.version - base_version
+        if missed > len(self.history):
+            raise OperationError("operation base version is too old")
+
+        if missed:
+            for _, concurrent in self.history.last(missed):
+                ops = OTService.transform(ops, concurrent)
+
+        self.code = OTService.apply(self.code, ops)
+        self.version += 1
+        self.history.append(self.version, ops)
+
+        if author is not None:
+            self.author_versions[author] = self.version
+            if len(self.author_versions) > len(self.history):
+                self._forget_authors()
+        return ops
+
+    def _forget_authors(self):
+        """
+        Drop authors whose latest operation has left the history
+
+        Any operation they could send now that breaks the rule is based on a
+        version older than the history and is rejected as too old anyway.
+        """
+        oldest = self.version - len(self.history)
+        self.author_versions = {
+            author: version for author, version in self.author_versions.items() if version > oldest
+        }
+
+    def transform_position(self, position: int, base_version: int) -> Optional[int]:
+        """
+        Map a cursor position made at `base_version` onto the current version
+
+        Returns:
+            The position in the current document, or None if the operations
+            since `base_version` are no longer in the history
+        """
+        missed = self.version - base_version
+        if missed < 0 or missed > len(self.history):
+            return None
+
+        if missed:
+            for _, ops in self.history.last(missed):
+                for op in ops:
+                    if op["position"] >= position:
+                        continue
+                    if op["type"] == "insert":
+                        position += len(op["text"])
+                    else:
+                        position -= min(op["length"], position - op["position"])
+
+        return min(position, len(self.code))
+
+    def replace(self, code: str, language: Optional[str] = None) -> List[Dict]:
+        """
+        Replace the whole document (full-snapshot update)
+
+        The change is recorded as the operations between the old and new
+        document, so clients can still catch up and transform across it.
+
+        Returns:
+            The operations turning the old document into the new one
+        """
+        ops = diff_operations(self.code, code)
+        self.code = code
+        if language:
+            self.language = language
+        self.version += 1
+        self.history.append(self.version, ops)
+        return ops
+
+    def changes_since(self, epoch: Optional[str], version: int) -> Optional[List[Entry]]:
+        """
+        The edits a client that saw (`epoch`, `version`) is missing
+
+        Returns:
+            The missing edits, oldest first, or None if the client needs a
+            snapshot: the state is unknown, compacted away, or the edits are
+            larger than the document
+        """
+        if epoch != self.epoch:
+            # Only the state this document was loaded from carries over
+            if epoch is None or epoch != self.stored_epoch or version != self.stored_version:
+                return None
+
+        return self.history.since(version, self.version, max_chars=len(self.code))
@@ -0,0 +1,171 @@
+"""
+Server-side coalescing of cursor and presence updates
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Set
+from app.services.collaboration import hub
+from app.services.connection_manager import manager
+from app.services.metrics import WS_RECEIVE_TO_BROADCAST_SECONDS
+from app.services.wire_format import utc_timestamp
+
+# Milliseconds between aggregated cursor broadcasts for a room
+CURSOR_TICK_MS = int(os.getenv("CURSOR_TICK_MS", "40"))
+
+# Milliseconds over which joins and leaves are collected into one presence message
+PRESENCE_WINDOW_MS = int(os.getenv("PRESENCE_WINDOW_MS", "250"))
+
+
+class CursorCoalescer:
+    """
+    Buffers cursor positions per room and broadcasts them on a fixed tick
+
+    Only the latest position per user is kept, so positions overwritten
+    within one tick are never sent. Each tick sends a single `cursors`
+    message per room instead of one message per mouse or caret event.
+    """
+
+    def __init__(self, tick_ms: int = CURSOR_TICK_MS):
+        self.tick = tick_ms / 1000
+        # room_id -> user_id -> latest cursor entry
+        self.pending: Dict[str, Dict[str, dict]] = {}
+        # room_id -> perf_counter() time of its oldest pending update
+        self.first_pending: Dict[str, float] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def update(self, room_id: str, user_id: str, cursor_position):
+        """Record a user's latest cursor position"""
+        self.pending.setdefault(room_id, {})[user_id] = {
+            "userId": user_id,
+            "cursorPosition": cursor_position
+        }
+        self.first_pending.setdefault(room_id, time.perf_counter())
+
+        # The ticker only runs while there is something to send
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def flush(self):
+        """Broadcast one aggregated message for every room with pending cursors"""
+        pending, self.pending = self.pending, {}
+        first_pending, self.first_pending = self.first_pending, {}
+        timestamp = utc_timestamp()
+
+        for room_id, cursors in pending.items():
+            await hub.broadcast(room_id, {
+                "type": "cursors",
+                "cursors": list(cursors.values()),
+                "timestamp": timestamp
+            })
+            # The oldest update waited longest for the tick
+            WS_RECEIVE_TO_BROADCAST_SECONDS.observe(
+                time.perf_counter() - first_pending[room_id], ("cursor_move",)
+            )
+
+    async def _flush_loop(self):
+        """Flush on every tick until no cursor updates are pending"""
+        while self.pending:
+            await asyncio.sleep(self.tick)
+            await self.flush()
+
+    async def stop(self):
+        """Stop the ticker, dropping pending positions"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.pending.clear()
+        self.first_pending.clear()
+
+
+class PresenceBatcher:
+    """
+    Collects joins and leaves per room and broadcasts them as one diff
+
+    When a room's users change, the room is marked and, at the end of the
+    window, its current roster is compared with the one last broadcast. A
+    single `presence` message lists who joined and who left together with
+    the current `connectionCount`, so a crowd arriving at once costs one
+    message per client rather than one per client per arrival. A user that
+    joins and leaves within one window is never announced. Users with
+    several connections appear once in the roster. Rosters are per process:
+    each process announces its own connections to its own clients.
+    """
+
+    def __init__(self, window_ms: int = PRESENCE_WINDOW_MS):
+        self.window = window_ms / 1000
+        # Rooms whose connections changed since the last broadcast
+        self.pending: Set[str] = set()
+        # room_id -> users in the last presence broadcast
+        self.rosters: Dict[str, Set[str]] = {}
+        # room_id -> connectionCount in the last presence broadcast
+        self.counts: Dict[str, int] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def changed(self, room_id: str):
+        """Note that a user joined or left a room"""
+        self.pending.add(room_id)
+
+        # The ticker only runs while there is something to send
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def flush(self):
+        """Broadcast one presence diff for every room whose users changed"""
+        pending, self.pending = self.pending, set()
+        timestamp = utc_timestamp()
+
+        for room_id in pending:
+            roster = set(manager.get_roster(room_id))
+            connection_count = manager.get_connection_count(room_id)
+            previous = self.rosters.get(room_id, set())
+            if roster:
+                self.rosters[room_id] = roster
+            else:
+                self.rosters.pop(room_id, None)
+            previous_count = self.counts.pop(room_id, 0)
+            if connection_count:
+                self.counts[room_id] = connection_count
+
+            joined = sorted(roster - previous)
+            left = sorted(previous - roster)
+            if not joined and not left and connection_count == previous_count:
+                continue
+
+            # The roster and count only cover this process, so the diff only
+            # goes to this process's clients rather than through the backplane
+            await manager.broadcast(room_id, {
+                "type": "presence",
+                "joined": joined,
+                "left": left,
+                "connectionCount": connection_count,
+                "timestamp": timestamp
+            })
+
+    async def _flush_loop(self):
+        """Flush at the end of every window until no rooms are pending"""
+        while self.pending:
+            await asyncio.sleep(self.window)
+            await self.flush()
+
+    async def stop(self):
+        """Stop the ticker, dropping pending changes"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.pending.clear()
+
+
+# Global cursor coalescer instance
+cursor_coalescer = CursorCoalescer()
+
+# Global presence batcher instance
+presence_batcher = PresenceBatcher()
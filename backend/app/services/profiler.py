@@ -0,0 +1,307 @@
+"""
+Opt-in sampling of per-stage timings and per-room profiler captures
+"""
+import asyncio
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import re
+import tempfile
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from random import random
+from typing import Dict, List, Optional
+from app.services.metrics import STAGE_SECONDS
+
+# Fraction of WebSocket messages and REST requests timed stage by stage (0: off)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Directory profiler captures are written to
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "pairprog-profiles"))
+
+# Longest profiler capture, in seconds
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+
+# Functions listed in a capture's summary
+PROFILE_SUMMARY_LINES = 25
+
+_NOT_CAPTURING = nullcontext()
+
+
+class Sample:
+    """Stage durations accumulated while handling one sampled message or request"""
+
+    __slots__ = ("db",)
+
+    def __init__(self):
+        self.db = 0.0
+
+
+# The sampled message or request being handled, if any
+current_sample: contextvars.ContextVar[Optional[Sample]] = contextvars.ContextVar(
+    "current_sample", default=None
+)
+
+_NOT_SAMPLED = nullcontext()
+
+
+class SampleScope:
+    """Context manager making a sampling decision current for a block"""
+
+    __slots__ = ("sample", "_token")
+
+    def __init__(self, sample: Optional[Sample]):
+        self.sample = sample
+        self._token = None
+
+    def __enter__(self) -> Optional[Sample]:
+        self._token = current_sample.set(self.sample)
+        return self.sample
+
+    def __exit__(self, *exc_info):
+        current_sample.reset(self._token)
+
+
+class RoomCapture:
+    """
+    A cProfile capture of the code handling one room's messages
+
+    The profiler is enabled while any of the room's messages is being
+    handled, so the capture also contains whatever other tasks run while a
+    handler is suspended.
+    """
+
+    def __init__(self, room_id: str, seconds: float, path: str):
+        self.room_id = room_id
+        self.seconds = seconds
+        self.path = path
+        self.started_at = datetime.utcnow()
+        self.profile = cProfile.Profile()
+        self.messages = 0
+        self.finished = False
+        self._depth = 0
+
+    def __enter__(self):
+        if self.finished:
+            return self
+        if self._depth == 0:
+            self.profile.enable()
+        self._depth += 1
+        self.messages += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.finished:
+            return
+        self._depth -= 1
+        if self._depth == 0:
+            self.profile.disable()
+
+    def finish(self) -> Dict:
+        """Stop profiling, write the capture to `path` and summarize it"""
+        if not self.finished:
+            self.finished = True
+            if self._depth > 0:
+                self.profile.disable()
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.profile.dump_stats(self.path)
+        return self.status()
+
+    def summary(self) -> str:
+        """The most expensive functions by cumulative time"""
+        output = io.StringIO()
+        try:
+            stats = pstats.Stats(self.profile, stream=output)
+        except TypeError:
+            # Nothing was recorded
+            return ""
+        stats.sort_stats("cumulative").print_stats(PROFILE_SUMMARY_LINES)
+        return output.getvalue()
+
+    def status(self) -> Dict:
+        """Description of the capture"""
+        return {
+            "roomId": self.room_id,
+            "file": self.path,
+            "seconds": self.seconds,
+            "startedAt": self.started_at.isoformat(),
+            "messages": self.messages,
+            "finished": self.finished
+        }
+
+
+class Profiler:
+    """
+    Samples stage timings and captures profiles without restarting
+
+    Whether a WebSocket message or REST request is timed is decided once,
+    where it enters the process, and carried through all of its stages: in
+    `current_sample` while it is handled, in the backplane event, and on the
+    frames it sends. With a sample rate of 0 a stage costs one context
+    variable lookup. Timings go to the `pairprog_stage_seconds` histogram on
+    /metrics. The rate can be changed at runtime through the admin API.
+    """
+
+    def __init__(self, sample_rate: float = PROFILE_SAMPLE_RATE, directory: str = PROFILE_DIR):
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.capture: Optional[RoomCapture] = None
+        self.last_capture: Optional[Dict] = None
+        self._finish_handle: Optional[asyncio.TimerHandle] = None
+
+    def sampled(self) -> bool:
+        """Whether to time the current message or request"""
+        return self.sample_rate > 0 and random() < self.sample_rate
+
+    def active(self) -> bool:
+        """Whether the message or request being handled is sampled"""
+        return current_sample.get() is not None
+
+    def sampling(self, sampled: Optional[bool] = None):
+        """
+        Context manager timing the stages run in a block, or not
+
+        Args:
+            sampled: A decision made where the message entered the process,
+                e.g. carried in a backplane event; made here when omitted
+
+        Returns:
+            A context manager yielding the block's Sample, or None
+        """
+        if sampled is None:
+            sampled = self.sampled()
+        if not sampled and current_sample.get() is None:
+            return _NOT_SAMPLED
+        return SampleScope(Sample() if sampled else None)
+
+    def start(self, sampled: Optional[bool] = None) -> Optional[float]:
+        """
+        Start timing a stage if its message or request is sampled
+
+        Args:
+            sampled: The decision for stages run outside the message's
+                context, such as a frame's `sampled` flag in a writer task;
+                taken from `current_sample` when omitted
+
+        Returns:
+            A start time to pass to `record`, or None
+        """
+        if sampled is None:
+            sampled = current_sample.get() is not None
+        return time.perf_counter() if sampled else None
+
+    def record(self, route: str, stage: str, started: Optional[float]):
+        """Record a stage started with `start`, unless it was not sampled"""
+        if started is not None:
+            STAGE_SECONDS.observe(time.perf_counter() - started, (route, stage))
+
+    def record_query(self, seconds: float):
+        """Add a database statement's time to the sampled request, if any"""
+        sample = current_sample.get()
+        if sample is not None:
+            sample.db += seconds
+
+    def capturing(self, room_id: str):
+        """Context manager profiling a block if the room is being captured"""
+        capture = self.capture
+        if capture is not None and capture.room_id == room_id:
+            return capture
+        return _NOT_CAPTURING
+
+    def start_capture(self, room_id: str, seconds: float) -> Dict:
+        """
+        Start capturing a room's message handling for a number of seconds
+
+        Args:
+            room_id: The room identifier
+            seconds: Length of the capture
+
+        Returns:
+            The capture's status
+
+        Raises:
+            RuntimeError: If a capture is already running
+        """
+        if self.capture is not None:
+            raise RuntimeError(f"Already capturing room {self.capture.room_id}")
+
+        safe_room_id = re.sub(r"[^\w-]", "_", room_id)
+        path = os.path.join(self.directory, f"room-{safe_room_id}-{int(time.time())}.prof")
+        self.capture = RoomCapture(room_id, seconds, path)
+        self._finish_handle = asyncio.get_running_loop().call_later(seconds, self.finish_capture)
+        return self.capture.status()
+
+    def finish_capture(self) -> Optional[Dict]:
+        """Stop the running capture, if any, and write it to disk"""
+        if self._finish_handle is not None:
+            self._finish_handle.cancel()
+            self._finish_handle = None
+
+        capture, self.capture = self.capture, None
+        if capture is None:
+            return None
+
+        try:
+            status = capture.finish()
+            status["summary"] = capture.summary()
+        except Exception as e:
+            status = {**capture.status(), "error": str(e)}
+        self.last_capture = status
+        return status
+
+    def captures(self) -> List[str]:
+        """Capture files written so far"""
+        try:
+            return sorted(
+                os.path.join(self.directory, name)
+                for name in os.listdir(self.directory)
+                if name.endswith(".prof")
+            )
+        except FileNotFoundError:
+            return []
+
+    def status(self) -> Dict:
+        """Sampling settings and capture state"""
+        return {
+            "sampleRate": self.sample_rate,
+            "directory": self.directory,
+            "capture": self.capture.status() if self.capture is not None else None,
+            "lastCapture": self.last_capture,
+            "files": self.captures()
+        }
+
+
+class RequestProfilingMiddleware:
+    """
+    ASGI middleware timing a sample of REST requests
+
+    Records the total time and the database time of each sampled request by
+    route. Requests that are not sampled pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiler.sampled():
+            await self.app(scope, receive, send)
+            return
+
+        sample = Sample()
+        token = current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_sample.reset(token)
+            route = scope.get("route")
+            label = f"{scope['method']} {route.path if route is not None else 'unmatched'}"
+            STAGE_SECONDS.observe(time.perf_counter() - started, (label, "total"))
+            STAGE_SECONDS.observe(sample.db, (label, "db"))
+
+
+# Global profiler instance
+profiler = Profiler()
@@ -0,0 +1,120 @@
+"""
+Off-loop execution of autocomplete providers
+"""
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Where providers run: thread, process, or inline (on the event loop)
+AUTOCOMPLETE_EXECUTOR = os.getenv("AUTOCOMPLETE_EXECUTOR", "thread")
+
+# Worker threads or processes computing suggestions
+AUTOCOMPLETE_WORKERS = int(os.getenv("AUTOCOMPLETE_WORKERS", "4"))
+
+# Suggestions queued or running before new requests are turned away
+AUTOCOMPLETE_MAX_PENDING = int(os.getenv("AUTOCOMPLETE_MAX_PENDING", "64"))
+
+EXECUTOR_KINDS = ("thread", "process", "inline")
+
+# Returned when the pool is saturated
+BUSY_SUGGESTION = {
+    "suggestion": "",
+    "confidence": 0.0,
+    "description": "Autocomplete is busy"
+}
+
+
+class ProviderExecutor:
+    """
+    Runs provider calls in a thread or process pool with admission control
+
+    Work is counted from submission until the worker finishes it, so a
+    request abandoned by its caller still occupies its slot while it runs.
+    Once `max_pending` calls are outstanding, new ones are rejected at once
+    instead of queueing behind them. Providers that release the GIL (native
+    tokenizers, model runtimes) suit the thread pool; pure-Python providers
+    need the process pool to keep the event loop responsive.
+    """
+
+    def __init__(
+        self,
+        kind: str = AUTOCOMPLETE_EXECUTOR,
+        workers: int = AUTOCOMPLETE_WORKERS,
+        max_pending: int = AUTOCOMPLETE_MAX_PENDING
+    ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unsupported AUTOCOMPLETE_EXECUTOR: {kind}")
+
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self._pool: Optional[Executor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_pool(self) -> Executor:
+        """Create the pool on first use"""
+        if self._pool is None:
+            if self.kind == "process":
+                self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="autocomplete"
+                )
+        return self._pool
+
+    async def submit(self, func: Callable[..., Dict], *args) -> Optional[Dict]:
+        """
+        Run a provider call off the event loop
+
+        Args:
+            func: Provider function; must be picklable for the process pool
+            *args: Arguments for `func`
+
+        Returns:
+            The function's result, or None if the pool is saturated
+        """
+        if self.kind == "inline":
+            self.completed += 1
+            return func(*args)
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return None
+
+        loop = asyncio.get_running_loop()
+        future = self._get_pool().submit(func, *args)
+        self.pending += 1
+        future.add_done_callback(lambda _: loop.call_soon_threadsafe(self._release))
+
+        # Cancelling the caller also drops the call if it has not started
+        return await asyncio.wrap_future(future)
+
+    def _release(self):
+        """Free the slot of a finished or dropped call"""
+        self.pending -= 1
+        self.completed += 1
+
+    def shutdown(self):
+        """Stop the pool, dropping calls that have not started"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict:
+        """Pool configuration and counters"""
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "maxPending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+
+# Global provider executor instance
+provider_executor = ProviderExecutor()
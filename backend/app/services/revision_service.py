@@ -0,0 +1,221 @@
+"""
+Delta-encoded storage of room revisions
+"""
+import json
+import os
+import zlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import CodeRevision, CodeState
+from app.services.edit_log import Entry
+from app.services.ot_service import OTService
+
+# Versions between full checkpoints of a room's document
+REVISION_CHECKPOINT_INTERVAL = int(os.getenv("REVISION_CHECKPOINT_INTERVAL", "200"))
+
+CHECKPOINT = "checkpoint"
+DELTA = "delta"
+
+
+class RevisionService:
+    """
+    Service for writing and reading stored revisions
+
+    Saving a room appends one delta row with the edits since the last saved
+    version, and only writes the full document as a checkpoint every
+    REVISION_CHECKPOINT_INTERVAL versions (or when the edits are not
+    available), so bytes written follow the size of the edits rather than the
+    size of the document. Checkpoints bound the number of deltas replayed
+    to rebuild a version.
+    """
+
+    @staticmethod
+    def encode_changes(changes: List[Entry]) -> bytes:
+        """Compress a list of (version, ops) edits"""
+        return zlib.compress(json.dumps(changes, separators=(",", ":")).encode())
+
+    @staticmethod
+    def decode_changes(data: bytes) -> List[Entry]:
+        """Decompress a list of (version, ops) edits"""
+        return [(version, ops) for version, ops in json.loads(zlib.decompress(data))]
+
+    @staticmethod
+    def encode_code(code: str) -> bytes:
+        """Compress a full document"""
+        return zlib.compress(code.encode())
+
+    @staticmethod
+    def decode_code(data: bytes) -> str:
+        """Decompress a full document"""
+        return zlib.decompress(data).decode()
+
+    @staticmethod
+    def save(
+        db: AsyncSession,
+        code_state: CodeState,
+        code: str,
+        language: str,
+        version: int,
+        epoch: Optional[str],
+        changes: Optional[List[Entry]]
+    ) -> bool:
+        """
+        Add the revision bringing a stored room up to `version` to the session
+
+        Args:
+            db: Database session
+            code_state: The room's loaded code state
+            code: Document at `version`
+            language: Programming language
+            version: Document version
+            epoch: Document epoch
+            changes: Edits made since the document was last saved, oldest
+                first, or None if they are not available
+
+        Returns:
+            False if the room was already stored at `version` or later (for
+            example by another process)
+        """
+        stored = code_state.version or 0
+        if version <= stored:
+            return False
+
+        # Another process may have saved some of the edits already
+        if changes is not None:
+            changes = [(change_version, ops) for change_version, ops in changes if change_version > stored]
+
+        contiguous = (
+            bool(changes)
+            and changes[0][0] == stored + 1
+            and changes[-1][0] == version
+        )
+        due = version - (code_state.checkpoint_version or 0) >= REVISION_CHECKPOINT_INTERVAL
+
+        if contiguous:
+            db.add(CodeRevision(
+                room_id=code_state.room_id,
+                kind=DELTA,
+                base_version=stored,
+                version=version,
+                data=RevisionService.encode_changes(changes)
+            ))
+
+        # Without the edits, the versions since the last save are not kept
+        if due or not contiguous:
+            db.add(CodeRevision(
+                room_id=code_state.room_id,
+                kind=CHECKPOINT,
+                base_version=stored,
+                version=version,
+                data=RevisionService.encode_code(code)
+            ))
+            code_state.code = code
+            code_state.checkpoint_version = version
+
+        code_state.language = language
+        code_state.version = version
+        code_state.epoch = epoch
+        code_state.updated_at = datetime.utcnow()
+        return True
+
+    @staticmethod
+    def replay(code: str, code_version: int, deltas: List[CodeRevision], version: int) -> Optional[str]:
+        """
+        Apply stored deltas to a document
+
+        Args:
+            code: Document at `code_version`
+            code_version: Version of `code`
+            deltas: Delta rows after `code_version`, in version order
+            version: Version to stop at
+
+        Returns:
+            The document at `version`, or None if the deltas have a gap
+        """
+        for delta in deltas:
+            for change_version, ops in RevisionService.decode_changes(delta.data):
+                if change_version <= code_version:
+                    continue
+                if change_version > version:
+                    break
+                if change_version != code_version + 1:
+                    return None
+                code = OTService.apply(code, ops)
+                code_version = change_version
+
+        return code if code_version == version else None
+
+    @staticmethod
+    def current(code_state: CodeState, deltas: List[CodeRevision]) -> Tuple[str, int]:
+        """
+        Rebuild a room's latest stored document
+
+        Args:
+            code_state: The room's code state
+            deltas: Its delta rows after `checkpoint_version`, in version order,
+                loaded in the same query as the code state
+
+        Returns:
+            (code, version); the checkpoint alone if the deltas are incomplete
+        """
+        checkpoint_version = code_state.checkpoint_version or 0
+        version = code_state.version or 0
+        if version <= checkpoint_version:
+            return code_state.code, version
+
+        code = RevisionService.replay(code_state.code, checkpoint_version, deltas, version)
+        if code is None:
+            return code_state.code, checkpoint_version
+        return code, version
+
+    @staticmethod
+    async def get_revision(db: AsyncSession, room_id: str, version: int) -> Optional[str]:
+        """
+        Rebuild a room's document as it was at `version`
+
+        Args:
+            db: Database session
+            room_id: The room identifier
+            version: Document version
+
+        Returns:
+            The document, or None if that version is not stored
+        """
+        result = await db.execute(
+            select(CodeRevision)
+            .where(
+                CodeRevision.room_id == room_id,
+                CodeRevision.kind == CHECKPOINT,
+                CodeRevision.version <= version
+            )
+            .order_by(CodeRevision.version.desc())
+            .limit(1)
+        )
+        checkpoint = result.scalars().first()
+
+        if checkpoint is not None:
+            code, code_version = RevisionService.decode_code(checkpoint.data), checkpoint.version
+        else:
+            # Rooms stored before revisions were kept start from their code state
+            result = await db.execute(select(CodeState).where(CodeState.room_id == room_id))
+            code_state = result.scalars().first()
+            if code_state is None or (code_state.checkpoint_version or 0) > version:
+                return None
+            code, code_version = code_state.code, code_state.checkpoint_version or 0
+
+        if code_version == version:
+            return code
+
+        result = await db.execute(
+            select(CodeRevision)
+            .where(
+                CodeRevision.room_id == room_id,
+                CodeRevision.kind == DELTA,
+                CodeRevision.version > code_version,
+                CodeRevision.base_version < version
+            )
+            .order_by(CodeRevision.version)
+        )
+        return RevisionService.replay(code, code_version, result.scalars().all(), version)
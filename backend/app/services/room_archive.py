@@ -0,0 +1,186 @@
+"""
+Compressed archive of rooms that have not been edited for a long time
+"""
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import AbstractSet, Dict, List
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager
+from sqlalchemy.orm.exc import StaleDataError
+from app.models import ArchivedRoom, CodeRevision, CodeState, Room
+from app.services.revision_service import CHECKPOINT, RevisionService
+from app.services.room_cache import room_cache
+
+
+class RoomArchiveService:
+    """
+    Service for moving cold rooms out of the hot tables and back
+
+    Archiving replaces a room's rows in rooms, code_states and code_revisions
+    with one compressed row in archived_rooms, so the hot tables and their
+    indexes grow with the rooms in use rather than every room ever created.
+    A room is restored, with its revision history, the next time it is opened.
+    """
+
+    @staticmethod
+    def pack(code_state: CodeState, revisions: List[CodeRevision]) -> bytes:
+        """Compress a room's code state and revisions into one blob"""
+        return zlib.compress(json.dumps({
+            "codeStateId": code_state.id,
+            "code": code_state.code,
+            "language": code_state.language,
+            "version": code_state.version or 0,
+            "epoch": code_state.epoch,
+            "checkpointVersion": code_state.checkpoint_version or 0,
+            # Decoded so the whole room is compressed together
+            "revisions": [
+                [
+                    revision.kind,
+                    revision.base_version,
+                    revision.version,
+                    RevisionService.decode_code(revision.data)
+                    if revision.kind == CHECKPOINT
+                    else RevisionService.decode_changes(revision.data),
+                    revision.created_at.isoformat() if revision.created_at else None
+                ]
+                for revision in revisions
+            ]
+        }, separators=(",", ":")).encode(), 9)
+
+    @staticmethod
+    def unpack(data: bytes) -> Dict:
+        """Decompress an archived room"""
+        return json.loads(zlib.decompress(data))
+
+    @staticmethod
+    async def archive_rooms(
+        db: AsyncSession,
+        before: datetime,
+        limit: int,
+        exclude: AbstractSet[str] = frozenset()
+    ) -> int:
+        """
+        Archive the rooms least recently edited before a cutoff
+
+        Args:
+            db: Database session
+            before: Rooms whose code was last written before this are archived
+            limit: Maximum number of rooms archived
+            exclude: Rooms to keep, e.g. those loaded in this process
+
+        Returns:
+            Number of rooms archived
+        """
+        result = await db.execute(
+            select(Room)
+            .join(Room.code_state)
+            .options(contains_eager(Room.code_state))
+            .where(CodeState.updated_at < before)
+            .order_by(CodeState.updated_at)
+            .limit(limit)
+        )
+        rooms = [room for room in result.scalars().all() if room.id not in exclude]
+        if not rooms:
+            return 0
+
+        room_ids = [room.id for room in rooms]
+        result = await db.execute(
+            select(CodeRevision)
+            .where(CodeRevision.room_id.in_(room_ids))
+            .order_by(CodeRevision.version, CodeRevision.id)
+        )
+        revisions = defaultdict(list)
+        for revision in result.scalars().all():
+            revisions[revision.room_id].append(revision)
+
+        now = datetime.utcnow()
+        for room in rooms:
+            db.add(ArchivedRoom(
+                room_id=room.id,
+                created_at=room.created_at,
+                archived_at=now,
+                data=RoomArchiveService.pack(room.code_state, revisions[room.id])
+            ))
+
+        # A room saved since it was read is no longer cold; try again next time
+        deleted = await db.execute(
+            delete(CodeState)
+            .where(CodeState.room_id.in_(room_ids), CodeState.updated_at < before)
+            .execution_options(synchronize_session=False)
+        )
+        if deleted.rowcount != len(room_ids):
+            await db.rollback()
+            return 0
+
+        await db.execute(
+            delete(CodeRevision)
+            .where(CodeRevision.room_id.in_(room_ids))
+            .execution_options(synchronize_session=False)
+        )
+        await db.execute(
+            delete(Room)
+            .where(Room.id.in_(room_ids))
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        for room_id in room_ids:
+            room_cache.invalidate(room_id)
+
+        return len(room_ids)
+
+    @staticmethod
+    async def restore(db: AsyncSession, room_id: str) -> bool:
+        """
+        Move an archived room back to the hot tables
+
+        Args:
+            db: Database session
+            room_id: The room identifier
+
+        Returns:
+            Whether the room exists again (False if it was never archived)
+        """
+        archived = await db.get(ArchivedRoom, room_id)
+        if archived is None:
+            return False
+
+        state = RoomArchiveService.unpack(archived.data)
+        now = datetime.utcnow()
+
+        db.add(Room(id=room_id, created_at=archived.created_at, updated_at=now))
+        # Counts as an edit, so the room is not archived again straight away
+        db.add(CodeState(
+            id=state["codeStateId"],
+            room_id=room_id,
+            code=state["code"],
+            language=state["language"],
+            version=state["version"],
+            epoch=state["epoch"],
+            checkpoint_version=state["checkpointVersion"],
+            updated_at=now
+        ))
+        for kind, base_version, version, payload, created_at in state["revisions"]:
+            db.add(CodeRevision(
+                room_id=room_id,
+                kind=kind,
+                base_version=base_version,
+                version=version,
+                data=RevisionService.encode_code(payload)
+                if kind == CHECKPOINT
+                else RevisionService.encode_changes(payload),
+                created_at=datetime.fromisoformat(created_at) if created_at else now
+            ))
+        await db.delete(archived)
+
+        try:
+            await db.commit()
+        except (IntegrityError, StaleDataError):
+            # Restored concurrently by another request or process
+            await db.rollback()
+
+        return True
@@ -0,0 +1,130 @@
+"""
+Read-through cache of persisted room state
+"""
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+from app.services.metrics import metrics
+
+# Maximum number of cached rooms
+ROOM_CACHE_SIZE = int(os.getenv("ROOM_CACHE_SIZE", "1024"))
+
+# Seconds a cached room stays valid; bounds staleness when other processes write
+ROOM_CACHE_TTL = float(os.getenv("ROOM_CACHE_TTL", "30"))
+
+# Cache hits and misses since the process started
+ROOM_CACHE_LOOKUPS = metrics.counter(
+    "pairprog_room_cache_lookups_total",
+    "Room cache lookups, by result",
+    ("result",)
+)
+
+
+def room_etag(room_id: str, code: str, language: str) -> str:
+    """Entity tag identifying one state of a room's document"""
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{room_id}\0{language}\0".encode())
+    digest.update(code.encode())
+    return f'"{digest.hexdigest()}"'
+
+
+class RoomSnapshot(NamedTuple):
+    """A room and its stored code, as last read from or written to the database"""
+    room_id: str
+    created_at: datetime
+    code: str
+    language: str
+    etag: str
+    version: int = 0
+    epoch: Optional[str] = None
+
+
+def make_snapshot(
+    room_id: str,
+    created_at: datetime,
+    code: str,
+    language: str,
+    version: int = 0,
+    epoch: Optional[str] = None
+) -> RoomSnapshot:
+    """Build a snapshot, computing its entity tag"""
+    return RoomSnapshot(room_id, created_at, code, language, room_etag(room_id, code, language), version, epoch)
+
+
+class RoomCache:
+    """
+    LRU cache of room snapshots with TTL expiry
+
+    RoomService fills it on reads and keeps it current on writes, so opening a
+    room that was recently read or written does not touch the database.
+    """
+
+    def __init__(self, max_size: int = ROOM_CACHE_SIZE, ttl: float = ROOM_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # room_id -> (expires_at, snapshot), least recently used first
+        self._entries: "OrderedDict[str, Tuple[float, RoomSnapshot]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, room_id: str) -> Optional[RoomSnapshot]:
+        """Get a cached room, or None on a miss"""
+        entry = self._entries.get(room_id)
+
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[room_id]
+            self.misses += 1
+            ROOM_CACHE_LOOKUPS.inc(labels=("miss",))
+            return None
+
+        self._entries.move_to_end(room_id)
+        self.hits += 1
+        ROOM_CACHE_LOOKUPS.inc(labels=("hit",))
+        return entry[1]
+
+    def put(self, snapshot: RoomSnapshot):
+        """Cache a room, evicting the least recently used if full"""
+        if self.max_size <= 0:
+            return
+
+        self._entries[snapshot.room_id] = (time.monotonic() + self.ttl, snapshot)
+        self._entries.move_to_end(snapshot.room_id)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def update_code(self, room_id: str, code: str, language: str, version: int = 0, epoch: Optional[str] = None):
+        """Record newly written code for a cached room"""
+        entry = self._entries.get(room_id)
+        if entry is not None:
+            self.put(make_snapshot(room_id, entry[1].created_at, code, language, version, epoch))
+
+    def invalidate(self, room_id: str):
+        """Drop a room from the cache"""
+        self._entries.pop(room_id, None)
+
+    def stats(self) -> Dict:
+        """Cache size and counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Global room cache instance
+room_cache = RoomCache()
+
+metrics.gauge(
+    "pairprog_room_cache_entries",
+    "Rooms in this process's room cache",
+    lambda: room_cache.stats()["size"]
+)
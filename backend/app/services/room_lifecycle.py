@@ -0,0 +1,113 @@
+"""
+Background lifecycle of rooms: idle eviction and cold-room archival
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from app.database import SessionLocal
+from app.services.document_store import document_store
+from app.services.metrics import metrics
+from app.services.room_archive import RoomArchiveService
+
+# Seconds between lifecycle passes
+ROOM_LIFECYCLE_INTERVAL = float(os.getenv("ROOM_LIFECYCLE_INTERVAL", "30"))
+
+# Days without edits before a room is moved to the archive (0: never archive)
+ROOM_ARCHIVE_AFTER_DAYS = float(os.getenv("ROOM_ARCHIVE_AFTER_DAYS", "30"))
+
+# Rooms archived per pass, bounding the work of one pass
+ROOM_ARCHIVE_BATCH = int(os.getenv("ROOM_ARCHIVE_BATCH", "200"))
+
+# Rooms handled by this process's lifecycle passes, by action
+ROOM_LIFECYCLE_ROOMS = metrics.counter(
+    "pairprog_room_lifecycle_rooms_total",
+    "Documents evicted and rooms archived by lifecycle passes",
+    ("action",)
+)
+
+
+class RoomLifecycle:
+    """
+    Ages rooms out of memory and out of the hot tables
+
+    Every `interval` seconds, documents idle for longer than the document
+    store's TTL are unloaded, and up to `archive_batch` rooms not edited for
+    `archive_after_days` are moved to the archive. Archived rooms are restored
+    by RoomService when they are next opened.
+    """
+
+    def __init__(
+        self,
+        interval: float = ROOM_LIFECYCLE_INTERVAL,
+        archive_after_days: float = ROOM_ARCHIVE_AFTER_DAYS,
+        archive_batch: int = ROOM_ARCHIVE_BATCH
+    ):
+        self.interval = interval
+        self.archive_after_days = archive_after_days
+        self.archive_batch = archive_batch
+        self.evicted = 0
+        self.archived = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> Dict:
+        """
+        Run one lifecycle pass
+
+        Returns:
+            Number of documents evicted and rooms archived by this pass
+        """
+        evicted = await document_store.evict_idle()
+        self.evicted += evicted
+        ROOM_LIFECYCLE_ROOMS.inc(evicted, ("evicted",))
+
+        archived = 0
+        if self.archive_after_days > 0:
+            before = datetime.utcnow() - timedelta(days=self.archive_after_days)
+            async with SessionLocal() as db:
+                # Rooms loaded here may have edits that are not saved yet
+                archived = await RoomArchiveService.archive_rooms(
+                    db, before, self.archive_batch, exclude=document_store.documents.keys()
+                )
+            self.archived += archived
+            ROOM_LIFECYCLE_ROOMS.inc(archived, ("archived",))
+
+        return {"evicted": evicted, "archived": archived}
+
+    async def _loop(self):
+        """Run a pass every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Room lifecycle error: {e}")
+
+    def start(self):
+        """Start the background passes"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Stop the background passes"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict:
+        """Lifecycle settings and counters"""
+        return {
+            "intervalSeconds": self.interval,
+            "archiveAfterDays": self.archive_after_days,
+            "evicted": self.evicted,
+            "archived": self.archived,
+            "documents": document_store.stats()
+        }
+
+
+# Global room lifecycle instance
+room_lifecycle = RoomLifecycle()
@@ -2,15 +2,32 @@
 Room management service
 """
 import uuid
-from sqlalchemy.orm import Session
-from app.models import Room, CodeState
+from typing import Dict, List, NamedTuple, Optional
+from sqlalchemy import and_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Room, CodeRevision, CodeState
+from app.services.edit_log import Entry
+from app.services.metrics import DB_COMMIT_SECONDS
+from app.services.revision_service import CHECKPOINT, DELTA, RevisionService
+from app.services.room_archive import RoomArchiveService
+from app.services.room_cache import RoomSnapshot, make_snapshot, room_cache
 from datetime import datetime
 
+class DocumentUpdate(NamedTuple):
+    """A room's live document, captured for saving"""
+    code: str
+    language: str
+    version: int
+    epoch: Optional[str]
+    # Edits since the document was last saved, None if no longer available
+    changes: Optional[List[Entry]]
+
 class RoomService:
     """Service for managing rooms"""
     
     @staticmethod
-    def create_room(db: Session) -> Room:
+    async def create_room(db: AsyncSession) -> Room:
         """Create a new room with unique ID"""
         room_id = str(uuid.uuid4())[:8]  # Short room ID for easier sharing
         
@@ -31,31 +48,134 @@ class RoomService:
         )
         db.add(code_state)
         
-        db.commit()
-        db.refresh(room)
+        # First checkpoint, so every version of the room can be rebuilt
+        db.add(CodeRevision(
+            room_id=room_id,
+            kind=CHECKPOINT,
+            base_version=0,
+            version=0,
+            data=RevisionService.encode_code(code_state.code)
+        ))
+        
+        with DB_COMMIT_SECONDS.time(("create_room",)):
+            await db.commit()
+        
+        # The room is usually opened right after it is created and shared
+        room_cache.put(make_snapshot(room.id, room.created_at, code_state.code, code_state.language))
         
         return room
     
     @staticmethod
-    def get_room(db: Session, room_id: str) -> Room:
-        """Get room by ID"""
-        return db.query(Room).filter(Room.id == room_id).first()
+    async def get_room_snapshot(db: AsyncSession, room_id: str, cached: bool = True) -> Optional[RoomSnapshot]:
+        """
+        Get a room with its stored code, from the room cache when possible
+        
+        On a miss the room, its code state and the deltas saved after the
+        stored checkpoint are read in one query. Archived rooms are restored
+        first.
+        
+        Args:
+            db: Database session
+            room_id: The room identifier
+            cached: Whether a cached snapshot may be returned
+            
+        Returns:
+            The room's snapshot, or None if the room does not exist
+        """
+        snapshot = room_cache.get(room_id) if cached else None
+        if snapshot is not None:
+            return snapshot
+        
+        # One row per delta to replay, or a single row without deltas
+        query = (
+            select(Room, CodeState, CodeRevision)
+            .outerjoin(CodeState, CodeState.room_id == Room.id)
+            .outerjoin(CodeRevision, and_(
+                CodeRevision.room_id == Room.id,
+                CodeRevision.kind == DELTA,
+                CodeRevision.version > CodeState.checkpoint_version
+            ))
+            .where(Room.id == room_id)
+            .order_by(CodeRevision.version)
+        )
+        rows = (await db.execute(query)).all()
+        if not rows:
+            if not await RoomArchiveService.restore(db, room_id):
+                return None
+            rows = (await db.execute(query)).all()
+            if not rows:
+                return None
+        
+        room, code_state, _ = rows[0]
+        if code_state is None:
+            snapshot = make_snapshot(room.id, room.created_at, "", "python")
+        else:
+            # The stored code is a checkpoint; replay the deltas saved after it
+            deltas = [delta for _, _, delta in rows if delta is not None]
+            code, version = RevisionService.current(code_state, deltas)
+            snapshot = make_snapshot(
+                room.id,
+                room.created_at,
+                code,
+                code_state.language,
+                version,
+                code_state.epoch
+            )
+        room_cache.put(snapshot)
+        return snapshot
     
     @staticmethod
-    def get_code_state(db: Session, room_id: str) -> CodeState:
-        """Get code state for a room"""
-        return db.query(CodeState).filter(CodeState.room_id == room_id).first()
+    async def save_code_states(db: AsyncSession, updates: Dict[str, DocumentUpdate]) -> int:
+        """
+        Write several rooms' documents in a single commit
+        
+        Each room gets one revision row: a compressed delta of its new edits,
+        or a checkpoint of the whole document when one is due.
+        
+        Args:
+            db: Database session
+            updates: Mapping of room_id to its captured document
+            
+        Returns:
+            Number of rooms written
+        """
+        if not updates:
+            return 0
+        
+        try:
+            return await RoomService._save_code_states(db, updates)
+        except IntegrityError:
+            # Another process holding the same rooms saved the same versions
+            # concurrently; re-reading the code states skips what it wrote
+            await db.rollback()
+            return await RoomService._save_code_states(db, updates)
     
     @staticmethod
-    def update_code_state(db: Session, room_id: str, code: str, language: str = "python") -> CodeState:
-        """Update code state for a room"""
-        code_state = db.query(CodeState).filter(CodeState.room_id == room_id).first()
-        
-        if code_state:
-            code_state.code = code
-            code_state.language = language
-            code_state.updated_at = datetime.utcnow()
-            db.commit()
-            db.refresh(code_state)
-        
-        return code_state
+    async def _save_code_states(db: AsyncSession, updates: Dict[str, DocumentUpdate]) -> int:
+        """Write several rooms' documents in a single commit, once"""
+        result = await db.execute(select(CodeState).where(CodeState.room_id.in_(list(updates))))
+        code_states = list(result.scalars().all())
+        
+        # Rooms archived by another process while loaded here are restored
+        missing = set(updates) - {code_state.room_id for code_state in code_states}
+        restored = [room_id for room_id in missing if await RoomArchiveService.restore(db, room_id)]
+        if restored:
+            result = await db.execute(select(CodeState).where(CodeState.room_id.in_(restored)))
+            code_states.extend(result.scalars().all())
+        
+        saved = []
+        for code_state in code_states:
+            update = updates[code_state.room_id]
+            if RevisionService.save(
+                db, code_state, update.code, update.language, update.version, update.epoch, update.changes
+            ):
+                saved.append(code_state.room_id)
+        
+        with DB_COMMIT_SECONDS.time(("save_code_states",)):
+            await db.commit()
+        
+        for room_id in saved:
+            update = updates[room_id]
+            room_cache.update_code(room_id, update.code, update.language, update.version, update.epoch)
+        
+        return len(saved)
@@ -0,0 +1,197 @@
+"""
+Broadcast-only delivery to read-only spectators
+"""
+import asyncio
+import os
+from typing import TYPE_CHECKING, Dict, Optional, Set
+from app.services.document_store import document_store
+from app.services.metrics import metrics
+from app.services.wire_format import Frame, utc_timestamp
+
+if TYPE_CHECKING:
+    from app.services.connection_manager import ClientConnection
+
+# Milliseconds between document updates sent to a room's spectators (0: every edit)
+SPECTATOR_SNAPSHOT_MS = int(os.getenv("SPECTATOR_SNAPSHOT_MS", "200"))
+
+# Message types summarized by the next spectator update instead of forwarded
+EDIT_MESSAGE_TYPES = {"operation", "code_update"}
+
+
+class SpectatorFanout:
+    """
+    Sends a room's changes to its spectators on a fixed interval
+
+    Spectators are kept apart from the room's editors: they are not counted
+    in `connectionCount`, do not announce themselves, and are not visited by
+    the editors' broadcasts. Instead, every `interval` each room with new
+    edits gets one update per protocol, shared by all of its spectators, so
+    the cost of an edit does not grow with the audience. Operation-protocol
+    spectators receive the edits since the previous update as a `changes`
+    message; entries at or below a spectator's own version are already
+    applied and should be skipped. Snapshot-protocol spectators receive the
+    whole document.
+    """
+
+    def __init__(self, interval_ms: int = SPECTATOR_SNAPSHOT_MS):
+        self.interval = interval_ms / 1000
+        # room_id -> spectator connections
+        self.rooms: Dict[str, Set["ClientConnection"]] = {}
+        # room_id -> document version its spectators were last sent
+        self.sent_versions: Dict[str, int] = {}
+        # Rooms edited since their last update
+        self.pending: Set[str] = set()
+        # room_id -> latest cursors frame not yet sent
+        self.cursors: Dict[str, Frame] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def add(self, client: "ClientConnection"):
+        """Register a spectator that has been sent the current document"""
+        room_id = client.room_id
+        if room_id not in self.rooms:
+            self.rooms[room_id] = set()
+            document = document_store.get(room_id)
+            if document is not None:
+                self.sent_versions[room_id] = document.version
+        self.rooms[room_id].add(client)
+
+    def remove(self, client: "ClientConnection"):
+        """Unregister a spectator"""
+        room_id = client.room_id
+        spectators = self.rooms.get(room_id)
+        if spectators is None:
+            return
+
+        spectators.discard(client)
+        if not spectators:
+            del self.rooms[room_id]
+            self.sent_versions.pop(room_id, None)
+            self.pending.discard(room_id)
+            self.cursors.pop(room_id, None)
+
+    def count(self, room_id: str) -> int:
+        """Number of spectators in a room"""
+        return len(self.rooms.get(room_id, ()))
+
+    def publish(self, room_id: str, frame: Frame, snapshot_frame: Frame):
+        """
+        Pass a room broadcast on to its spectators
+
+        Args:
+            room_id: The room the message was broadcast to
+            frame: The message as sent to operation-protocol clients
+            snapshot_frame: The message as sent to snapshot-protocol clients
+        """
+        spectators = self.rooms.get(room_id)
+        if not spectators:
+            return
+
+        message_type = frame.type
+        if self.interval <= 0 or message_type not in EDIT_MESSAGE_TYPES | {"cursors"}:
+            # Unthrottled, or a rare message such as a presence change
+            for client in spectators:
+                client.send(frame if client.protocol == "ot" else snapshot_frame)
+            return
+
+        if message_type == "cursors":
+            # Only the newest positions are worth sending
+            self.cursors[room_id] = frame
+        else:
+            self.pending.add(room_id)
+
+        # The ticker only runs while there is something to send
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    def flush(self):
+        """Send one update to the spectators of every room with pending changes"""
+        pending, self.pending = self.pending, set()
+        cursors, self.cursors = self.cursors, {}
+
+        for room_id in pending | cursors.keys():
+            spectators = self.rooms.get(room_id)
+            if not spectators:
+                continue
+
+            frames = self._document_frames(room_id) if room_id in pending else {}
+            cursor_frame = cursors.get(room_id)
+            for client in spectators:
+                frame = frames.get(client.protocol)
+                if frame is not None:
+                    client.send(frame)
+                if cursor_frame is not None:
+                    client.send(cursor_frame)
+
+    def _document_frames(self, room_id: str) -> Dict[str, Frame]:
+        """Build a room's update in each protocol, if its document changed"""
+        document = document_store.get(room_id)
+        if document is None:
+            return {}
+
+        sent_version = self.sent_versions.get(room_id)
+        if sent_version == document.version:
+            return {}
+        self.sent_versions[room_id] = document.version
+
+        timestamp = utc_timestamp()
+        changes = (
+            document.history.since(sent_version, document.version, max_chars=len(document.code))
+            if sent_version is not None
+            else None
+        )
+        if changes is not None:
+            ot_message = {
+                "type": "changes",
+                "baseVersion": sent_version,
+                "version": document.version,
+                "language": document.language,
+                "changes": [{"version": version, "ops": ops} for version, ops in changes],
+                "timestamp": timestamp
+            }
+        else:
+            # Too far behind for the edit log, or cheaper to resend
+            ot_message = {
+                "type": "snapshot",
+                "code": document.code,
+                "language": document.language,
+                "version": document.version
+            }
+
+        return {
+            "ot": Frame(ot_message),
+            "snapshot": Frame({
+                "type": "code_update",
+                "code": document.code,
+                "language": document.language,
+                "version": document.version,
+                "timestamp": timestamp
+            })
+        }
+
+    async def _flush_loop(self):
+        """Flush on every interval until nothing is pending"""
+        while self.pending or self.cursors:
+            await asyncio.sleep(self.interval)
+            self.flush()
+
+    async def stop(self):
+        """Stop the ticker, dropping pending updates"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.pending.clear()
+        self.cursors.clear()
+
+
+# Global spectator fan-out instance
+spectator_fanout = SpectatorFanout()
+
+metrics.gauge(
+    "pairprog_active_spectators",
+    "Spectator WebSocket connections in this process",
+    lambda: sum(len(spectators) for spectators in spectator_fanout.rooms.values())
+)
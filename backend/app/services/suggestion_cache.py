@@ -0,0 +1,76 @@
+"""
+Bounded LRU cache for autocomplete suggestions
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# Maximum number of cached suggestions
+SUGGESTION_CACHE_SIZE = int(os.getenv("SUGGESTION_CACHE_SIZE", "4096"))
+
+# Seconds a cached suggestion stays valid
+SUGGESTION_CACHE_TTL = float(os.getenv("SUGGESTION_CACHE_TTL", "300"))
+
+
+class SuggestionCache:
+    """LRU cache with size- and TTL-based eviction and hit/miss counters"""
+
+    def __init__(self, max_size: int = SUGGESTION_CACHE_SIZE, ttl: float = SUGGESTION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        # key -> (expires_at, suggestion), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, Dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Dict]:
+        """Get a cached suggestion, or None on a miss"""
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, suggestion = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(suggestion)
+
+    def put(self, key: Hashable, suggestion: Dict):
+        """Cache a suggestion, evicting the least recently used if full"""
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = (time.monotonic() + self.ttl, dict(suggestion))
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every cached suggestion"""
+        self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Cache size and counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxSize": self.max_size,
+            "ttlSeconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hitRate": self.hits / lookups if lookups else 0.0
+        }
@@ -0,0 +1,285 @@
+"""
+Incremental per-room index of the names defined in a document
+"""
+import os
+import re
+from bisect import bisect_left, insort
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from app.services.text_diff import common_prefix, common_suffix
+
+# Distinct names indexed per room; further names are skipped until some are removed
+MAX_SYMBOLS_PER_ROOM = int(os.getenv("MAX_SYMBOLS_PER_ROOM", "10000"))
+
+# Completions returned for an identifier prefix
+MAX_COMPLETIONS = 5
+
+# Prefix matches examined when ranking completions
+MAX_CANDIDATES = 64
+
+# Lines an update may re-scan on the event loop; larger ones are built off the loop
+MAX_INLINE_RESCAN_LINES = 1000
+
+# Python and JavaScript definitions at the start of a line
+DEFINITION_PATTERN = re.compile(
+    r'^\s*(?:'
+    r'(?:async\s+)?def\s+(?P<function>\w+)\s*\((?P<params>[^)]*)'
+    r'|(?:export\s+)?(?:async\s+)?function\s*\*?\s*(?P<js_function>\w+)\s*\((?P<js_params>[^)]*)'
+    r'|(?:export\s+)?class\s+(?P<class>\w+)'
+    r'|(?:export\s+)?(?:const|let|var)\s+(?P<declared>[A-Za-z_$][\w$]*)'
+    r'|for\s+(?P<loop>[A-Za-z_]\w*)\s+in\b'
+    r'|(?:from\s+[\w.]+\s+)?import\s+(?P<imports>[\w.,\s]+?)\s*$'
+    r'|(?P<assigned>[A-Za-z_]\w*)\s*(?::[^=]*)?=(?!=)'
+    r')'
+)
+
+# A call being opened at the end of the line
+CALL_PATTERN = re.compile(r'(?<![\w.])([A-Za-z_]\w*)\s*\($')
+
+# An identifier being typed at the end of the line
+PREFIX_PATTERN = re.compile(r'(?<![\w.$])([A-Za-z_$][\w$]*)$')
+
+# Receivers that are not worth suggesting as parameters
+_IMPLICIT_PARAMS = {"self", "cls"}
+
+
+class Symbol(NamedTuple):
+    """A name defined in a document"""
+    name: str
+    kind: str
+    # Parameter list of a function, None for other kinds
+    params: Optional[str] = None
+
+
+_NO_SYMBOLS: Tuple[Symbol, ...] = ()
+
+
+def _parse_params(params: str) -> List[str]:
+    """Names of a function's parameters, without annotations or defaults"""
+    names = []
+    for param in params.split(","):
+        name = re.split(r'[:=]', param, 1)[0].strip().lstrip("*").strip()
+        if name.isidentifier() and name not in _IMPLICIT_PARAMS:
+            names.append(name)
+    return names
+
+
+def extract_symbols(line: str) -> Tuple[Symbol, ...]:
+    """
+    Find the names a single line defines
+
+    Args:
+        line: One line of code
+
+    Returns:
+        Symbols defined on the line (usually none or one)
+    """
+    match = DEFINITION_PATTERN.match(line)
+    if match is None:
+        return _NO_SYMBOLS
+
+    kind = match.lastgroup
+    if kind in ("params", "js_params"):
+        name = match.group("function") or match.group("js_function")
+        names = _parse_params(match.group(kind))
+        return (Symbol(name, "function", ", ".join(names)),) + tuple(
+            Symbol(param, "parameter") for param in names
+        )
+    if kind == "class":
+        return (Symbol(match.group(kind), "class"),)
+    if kind == "imports":
+        names = []
+        for part in match.group(kind).split(","):
+            words = part.split()
+            if words:
+                # "import a.b as c" binds c; "import a.b" binds a
+                names.append(words[-1] if len(words) == 3 and words[1] == "as" else words[0].split(".")[0])
+        return tuple(Symbol(name, "module") for name in names if name.isidentifier())
+    return (Symbol(match.group(kind), "variable"),)
+
+
+class SymbolIndex:
+    """
+    Names defined in a room's document, kept sorted for prefix lookup
+
+    The index remembers the document it was built from. `update` locates the
+    edited region by comparing the two strings and only re-scans the lines it
+    touches, so typing costs a string comparison rather than a full parse.
+    Every definition is reference-counted, so a name stays indexed while any
+    line defines it.
+    """
+
+    def __init__(self, max_symbols: int = MAX_SYMBOLS_PER_ROOM):
+        self.max_symbols = max_symbols
+        self._code = ""
+        # Symbols defined on each line of _code
+        self._line_symbols: List[Tuple[Symbol, ...]] = [_NO_SYMBOLS]
+        # name -> number of lines defining each variant of it
+        self._by_name: Dict[str, Counter] = {}
+        # Indexed names in sorted order
+        self._names: List[str] = []
+        self.skipped = 0
+
+    @staticmethod
+    def build(code: str, max_symbols: int = MAX_SYMBOLS_PER_ROOM) -> "SymbolIndex":
+        """Index a document from scratch; run in the provider executor for large documents"""
+        index = SymbolIndex(max_symbols)
+        index.update(code)
+        return index
+
+    def adopt(self, other: "SymbolIndex"):
+        """Take over the state of an index built elsewhere, e.g. by `build`"""
+        self._code = other._code
+        self._line_symbols = other._line_symbols
+        self._by_name = other._by_name
+        self._names = other._names
+        self.skipped = other.skipped
+
+    def _changed_region(self, code: str) -> Tuple[int, int, int]:
+        """
+        Whole-line region that differs between the indexed document and `code`
+
+        Returns:
+            Start of the region, and its end in the old and in the new document
+        """
+        old = self._code
+
+        # Characters changed between the unchanged ends
+        prefix = common_prefix(old, code)
+        suffix = common_suffix(old, code, min(len(old), len(code)) - prefix)
+
+        # Widen the change to whole lines
+        region_start = old.rfind("\n", 0, prefix) + 1
+        old_end = old.find("\n", len(old) - suffix)
+        old_end = len(old) if old_end == -1 else old_end
+        new_end = code.find("\n", len(code) - suffix)
+        new_end = len(code) if new_end == -1 else new_end
+        return region_start, old_end, new_end
+
+    def rescan_lines(self, code: str) -> int:
+        """Number of lines `update(code)` would scan"""
+        if code is self._code or code == self._code:
+            return 0
+        region_start, _, new_end = self._changed_region(code)
+        return code.count("\n", region_start, new_end) + 1
+
+    def update(self, code: str):
+        """
+        Bring the index up to date with the document
+
+        Args:
+            code: Current document
+        """
+        if code is self._code:
+            return
+
+        old = self._code
+        if code == old:
+            self._code = code
+            return
+
+        region_start, old_end, new_end = self._changed_region(code)
+
+        start = old.count("\n", 0, region_start)
+        end = start + old.count("\n", region_start, old_end) + 1
+
+        for symbols in self._line_symbols[start:end]:
+            for symbol in symbols:
+                self._remove(symbol)
+
+        changed = [extract_symbols(line) for line in code[region_start:new_end].split("\n")]
+        for symbols in changed:
+            for symbol in symbols:
+                self._add(symbol)
+
+        self._line_symbols[start:end] = changed
+        self._code = code
+
+    def _add(self, symbol: Symbol):
+        """Count one definition of a symbol"""
+        variants = self._by_name.get(symbol.name)
+        if variants is None:
+            if len(self._names) >= self.max_symbols:
+                self.skipped += 1
+                return
+            variants = self._by_name[symbol.name] = Counter()
+            insort(self._names, symbol.name)
+        variants[symbol] += 1
+
+    def _remove(self, symbol: Symbol):
+        """Forget one definition of a symbol"""
+        variants = self._by_name.get(symbol.name)
+        if variants is None or symbol not in variants:
+            # Skipped when the index was full
+            return
+
+        variants[symbol] -= 1
+        if variants[symbol] <= 0:
+            del variants[symbol]
+            if not variants:
+                del self._by_name[symbol.name]
+                del self._names[bisect_left(self._names, symbol.name)]
+
+    def get(self, name: str) -> Optional[Symbol]:
+        """The most frequently defined symbol with this name"""
+        variants = self._by_name.get(name)
+        if not variants:
+            return None
+        return variants.most_common(1)[0][0]
+
+    def complete(self, prefix: str, limit: int = MAX_COMPLETIONS) -> Tuple[Symbol, ...]:
+        """
+        Symbols whose names start with a prefix, best first
+
+        Names defined more often rank higher, then shorter names.
+
+        Args:
+            prefix: Start of an identifier
+            limit: Maximum number of symbols returned
+
+        Returns:
+            Matching symbols, excluding the prefix itself
+        """
+        candidates = []
+        index = bisect_left(self._names, prefix)
+        while index < len(self._names) and len(candidates) < MAX_CANDIDATES:
+            name = self._names[index]
+            if not name.startswith(prefix):
+                break
+            if name != prefix:
+                candidates.append((-sum(self._by_name[name].values()), len(name), name))
+            index += 1
+
+        candidates.sort()
+        return tuple(self.get(name) for _, _, name in candidates[:limit])
+
+    def hints(self, line: str) -> Tuple[Symbol, ...]:
+        """
+        Symbols relevant to the end of the current line
+
+        Args:
+            line: Current line up to the cursor
+
+        Returns:
+            The called function if a call is being opened, otherwise
+            completions for the identifier being typed
+        """
+        match = CALL_PATTERN.search(line)
+        if match is not None:
+            symbol = self.get(match.group(1))
+            return (symbol,) if symbol is not None and symbol.kind == "function" else _NO_SYMBOLS
+
+        match = PREFIX_PATTERN.search(line)
+        if match is not None:
+            return self.complete(match.group(1))
+
+        return _NO_SYMBOLS
+
+    def stats(self) -> Dict:
+        """Index size"""
+        return {
+            "lines": len(self._line_symbols),
+            "names": len(self._names),
+            "maxSymbols": self.max_symbols,
+            "skipped": self.skipped
+        }
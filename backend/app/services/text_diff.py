@@ -0,0 +1,68 @@
+"""
+Locating the changed region between two versions of a document
+"""
+from typing import Dict, List
+
+# Characters compared at a time when looking for the changed region
+_CHUNK = 4096
+
+
+def common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix of two strings"""
+    limit = min(len(a), len(b))
+    start = 0
+    # Skip equal chunks, then narrow down within the first unequal one
+    while start < limit and a[start:start + _CHUNK] == b[start:start + _CHUNK]:
+        start += _CHUNK
+    low, high = start, min(start + _CHUNK, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[start:middle] == b[start:middle]:
+            low = middle
+        else:
+            high = middle - 1
+    return min(low, limit)
+
+
+def common_suffix(a: str, b: str, limit: int) -> int:
+    """Length of the common suffix of two strings, at most `limit`"""
+    len_a, len_b = len(a), len(b)
+    length = 0
+    while length < limit and a[max(0, len_a - length - _CHUNK):len_a - length] == b[max(0, len_b - length - _CHUNK):len_b - length]:
+        length += _CHUNK
+    low, high = length, min(length + _CHUNK, limit)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a[len_a - middle:len_a - length] == b[len_b - middle:len_b - length]:
+            low = middle
+        else:
+            high = middle - 1
+    return min(low, limit)
+
+
+def diff_operations(old: str, new: str) -> List[Dict]:
+    """
+    Express the change from one document to another as operations
+
+    The change is the single region between the unchanged start and end of
+    the two documents, so a typical edit becomes one small delete and/or
+    insert rather than a copy of the whole document.
+
+    Args:
+        old: Previous document
+        new: New document
+
+    Returns:
+        Normalized operations turning `old` into `new`
+    """
+    prefix = common_prefix(old, new)
+    suffix = common_suffix(old, new, min(len(old), len(new)) - prefix)
+
+    ops = []
+    deleted = len(old) - prefix - suffix
+    if deleted:
+        ops.append({"type": "delete", "position": prefix, "length": deleted})
+    inserted = new[prefix:len(new) - suffix]
+    if inserted:
+        ops.append({"type": "insert", "position": prefix, "text": inserted})
+    return ops
@@ -0,0 +1,95 @@
+"""
+WebSocket wire formats and shared pre-encoded frames
+"""
+import json
+from datetime import datetime
+from typing import Dict, Union
+from fastapi import WebSocket, WebSocketDisconnect
+from app.services.profiler import profiler
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional; clients fall back to JSON
+    msgpack = None
+
+# Wire formats a client can ask for with ?encoding=...
+SUPPORTED_ENCODINGS = {"json", "msgpack"} if msgpack is not None else {"json"}
+
+
+def negotiate_encoding(requested: str) -> str:
+    """Pick the wire format for a client, falling back to JSON"""
+    return requested if requested in SUPPORTED_ENCODINGS else "json"
+
+
+def utc_timestamp() -> str:
+    """Timestamp for an outgoing event"""
+    return datetime.utcnow().isoformat()
+
+
+def encode_message(message: dict, encoding: str) -> Union[str, bytes]:
+    """Encode a message as a text (JSON) or binary (MessagePack) frame"""
+    if encoding == "msgpack":
+        return msgpack.packb(message, use_bin_type=True)
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def decode_message(data: Union[str, bytes]) -> dict:
+    """Decode an incoming frame; binary frames are MessagePack, text frames JSON"""
+    if isinstance(data, bytes):
+        if msgpack is None:
+            raise ValueError("binary frames require msgpack")
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+async def receive_frame(websocket: WebSocket) -> Union[str, bytes]:
+    """Receive the next text or binary frame from a client, undecoded"""
+    message = await websocket.receive()
+
+    if message["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(message.get("code", 1000))
+
+    if message.get("bytes") is not None:
+        return message["bytes"]
+    return message.get("text") or ""
+
+
+class Frame:
+    """
+    An outgoing message shared by every recipient
+
+    The message is encoded at most once per wire format, however many
+    clients in the room receive it. A frame sent while handling a sampled
+    message is `sampled`, so its encode and send stages are timed too.
+    """
+
+    __slots__ = ("message", "sampled", "_encoded")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.sampled = profiler.active()
+        self._encoded: Dict[str, Union[str, bytes]] = {}
+
+    @property
+    def type(self) -> str:
+        """The message type"""
+        return self.message.get("type")
+
+    def encode(self, encoding: str) -> Union[str, bytes]:
+        """Get the encoded frame for a wire format, encoding it on first use"""
+        data = self._encoded.get(encoding)
+        if data is None:
+            data = encode_message(self.message, encoding)
+            self._encoded[encoding] = data
+        return data
+
+
+async def send_frame(websocket: WebSocket, frame: Frame, encoding: str):
+    """Write a frame to a client in its wire format"""
+    started = profiler.start(frame.sampled)
+    data = frame.encode(encoding)
+    profiler.record(f"ws:{frame.type}", "encode", started)
+    if isinstance(data, bytes):
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
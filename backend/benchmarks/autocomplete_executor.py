@@ -0,0 +1,88 @@
+"""
+Event-loop responsiveness while autocomplete is saturated
+Runs a CPU-heavy provider inline, in the thread pool and in the process pool
+and measures how late a 5 ms ticker (standing in for broadcasts) wakes up
+
+Usage (from the backend directory):
+    python -m benchmarks.autocomplete_executor
+"""
+import asyncio
+import json
+import sys
+import time
+from app.services.provider_executor import ProviderExecutor
+
+# Seconds of load per executor kind
+DURATION = 2.0
+
+# Interval of the ticker measuring event-loop lag
+TICK = 0.005
+
+# CPU time spent per suggestion by the heavy provider
+WORK_SECONDS = 0.02
+
+# Concurrent clients requesting suggestions
+CLIENTS = 16
+
+def heavy_suggest(line: str, language: str) -> dict:
+    """A pure-Python provider that burns CPU while holding the GIL"""
+    deadline = time.perf_counter() + WORK_SECONDS
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(ord(char) for char in line)
+    return {"suggestion": str(total), "confidence": 0.5, "description": "heavy"}
+
+def percentile(values: list, fraction: float) -> float:
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+async def ticker(lags: list, stop: asyncio.Event):
+    """Record how late each tick fires, in milliseconds"""
+    while not stop.is_set():
+        expected = time.perf_counter() + TICK
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - expected) * 1000)
+
+async def client(executor: ProviderExecutor, stop: asyncio.Event, results: dict):
+    """Request suggestions back to back"""
+    while not stop.is_set():
+        result = await executor.submit(heavy_suggest, "value = compute(", "python")
+        results["busy" if result is None else "served"] += 1
+        # Back off when turned away; always yield (inline calls never do)
+        await asyncio.sleep(TICK if result is None else 0)
+
+async def run(kind: str) -> dict:
+    """Saturate one executor kind and report the loop lag"""
+    executor = ProviderExecutor(kind=kind, workers=2, max_pending=8)
+    # Start the pool before measuring
+    await executor.submit(heavy_suggest, "", "python")
+
+    stop = asyncio.Event()
+    lags: list = []
+    results = {"served": 0, "busy": 0}
+    tasks = [asyncio.create_task(ticker(lags, stop))]
+    tasks += [asyncio.create_task(client(executor, stop, results)) for _ in range(CLIENTS)]
+
+    await asyncio.sleep(DURATION)
+    stop.set()
+    await asyncio.gather(*tasks)
+    executor.shutdown()
+
+    return {
+        "executor": kind,
+        "loop_lag_p50_ms": round(percentile(lags, 0.50), 2),
+        "loop_lag_p99_ms": round(percentile(lags, 0.99), 2),
+        "loop_lag_max_ms": round(max(lags), 2),
+        "suggestions_per_sec": round(results["served"] / DURATION, 1),
+        "rejected": results["busy"],
+    }
+
+def main():
+    """Run the benchmark and print one JSON object per executor kind"""
+    for kind in ("inline", "thread", "process"):
+        print(json.dumps(asyncio.run(run(kind))))
+        sys.stdout.flush()
+
+if __name__ == "__main__":
+    main()
@@ -50,10 +50,8 @@ async def test_websocket_client(room_id: str, user_id: str):
                         print(f"\n📥 Code Update from {data.get('userId', 'unknown')}:")
                         print(f"   Code: {data['code'][:50]}...")
                         print(f"   Time: {data.get('timestamp', 'N/A')}")
-                    elif data["type"] == "user_joined":
-                        print(f"\n👥 User joined! Total connections: {data['connectionCount']}")
-                    elif data["type"] == "user_left":
-                        print(f"\n👋 User left. Remaining connections: {data['connectionCount']}")
+                    elif data["type"] == "presence":
+                        print(f"\n👥 Joined: {data['joined']}, left: {data['left']}. Total connections: {data['connectionCount']}")
                     else:
                         print(f"\n📥 Message: {data}")
                         
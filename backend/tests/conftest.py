@@ -0,0 +1,25 @@
+"""
+Shared fixtures: an in-memory database for the storage tests
+"""
+import os
+
+# The app reads its settings when imported
+os.environ["DATABASE_URL"] = "sqlite:///:memory:"
+
+import pytest
+from app.database import SessionLocal, engine, init_db
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def db():
+    """A session on a fresh in-memory database"""
+    await init_db()
+    async with SessionLocal() as session:
+        yield session
+    # Closing the only connection discards the in-memory database
+    await engine.dispose()
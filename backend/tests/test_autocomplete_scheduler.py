@@ -0,0 +1,97 @@
+"""
+Latest-wins autocomplete scheduling: superseding and the deadline
+"""
+import asyncio
+import pytest
+from app.services.autocomplete_scheduler import DEADLINE_SUGGESTION, AutocompleteScheduler
+
+pytestmark = pytest.mark.anyio
+
+
+class Provider:
+    """Records which calls started and which were cancelled"""
+
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.started = []
+        self.cancelled = []
+
+    async def __call__(self, name: str):
+        self.started.append(name)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(name)
+            raise
+        return {"suggestion": name}
+
+
+async def test_newer_request_for_the_same_key_cancels_the_older():
+    scheduler = AutocompleteScheduler(deadline_ms=1000)
+    provider = Provider(delay=0.05)
+
+    first = asyncio.ensure_future(scheduler.run(("room", "alice"), provider, "first"))
+    await asyncio.sleep(0.01)
+    second = await scheduler.run(("room", "alice"), provider, "second")
+
+    assert await first is None
+    assert second == {"suggestion": "second"}
+    assert provider.cancelled == ["first"]
+    assert scheduler.stats()["superseded"] == 1
+    assert scheduler.stats()["pending"] == 0
+
+
+async def test_request_superseded_before_it_starts_does_no_work():
+    scheduler = AutocompleteScheduler(deadline_ms=1000)
+    provider = Provider()
+
+    results = await asyncio.gather(*(
+        scheduler.run(("room", "alice"), provider, f"keystroke {index}")
+        for index in range(5)
+    ))
+
+    assert results[:4] == [None] * 4
+    assert results[4] == {"suggestion": "keystroke 4"}
+    assert provider.started == ["keystroke 4"]
+
+
+async def test_requests_with_other_keys_run_side_by_side():
+    scheduler = AutocompleteScheduler(deadline_ms=1000)
+    provider = Provider(delay=0.01)
+
+    results = await asyncio.gather(
+        scheduler.run(("room", "alice"), provider, "alice"),
+        scheduler.run(("room", "bob"), provider, "bob"),
+        scheduler.run(None, provider, "anonymous"),
+        scheduler.run(None, provider, "anonymous"),
+    )
+
+    assert [result["suggestion"] for result in results] == ["alice", "bob", "anonymous", "anonymous"]
+    assert scheduler.stats()["superseded"] == 0
+
+
+async def test_slow_provider_returns_an_empty_suggestion_at_the_deadline():
+    scheduler = AutocompleteScheduler(deadline_ms=20)
+    provider = Provider(delay=10)
+
+    result = await asyncio.wait_for(scheduler.run(("room", "alice"), provider, "slow"), 1)
+
+    assert result == DEADLINE_SUGGESTION
+    assert provider.cancelled == ["slow"]
+    assert scheduler.stats()["timedOut"] == 1
+    assert scheduler.stats()["pending"] == 0
+
+
+async def test_cancelling_the_caller_is_not_treated_as_superseded():
+    scheduler = AutocompleteScheduler(deadline_ms=1000)
+    provider = Provider(delay=10)
+
+    caller = asyncio.ensure_future(scheduler.run(("room", "alice"), provider, "closed"))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    assert provider.cancelled == ["closed"]
+    assert scheduler.stats()["superseded"] == 0
+    assert scheduler.stats()["pending"] == 0
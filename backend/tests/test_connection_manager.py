@@ -0,0 +1,80 @@
+"""
+Overflow policies of a client's outbound queue
+"""
+from app.services.connection_manager import ClientConnection, build_snapshot_frame
+from app.services.document_store import document_store
+from app.services.ot_service import RoomDocument
+
+
+def cursors(*entries):
+    return {
+        "type": "cursors",
+        "cursors": [{"userId": user, "cursorPosition": position} for user, position in entries],
+        "timestamp": "2024-01-01T00:00:00"
+    }
+
+
+def operation(version):
+    return {"type": "operation", "version": version, "ops": []}
+
+
+def queued(client):
+    return [frame.message for frame in client.queue]
+
+
+def test_drop_cursor_keeps_each_users_newest_position():
+    client = ClientConnection(None, "room", "ot", queue_size=3, overflow_policy="drop_cursor")
+    client.send(cursors(("a", 1), ("b", 1)))
+    client.send(operation(1))
+    client.send(cursors(("a", 2)))
+
+    # Full: the cursor messages merge into the newest one's place
+    client.send(cursors(("c", 5)))
+    assert queued(client) == [operation(1), cursors(("a", 2), ("b", 1), ("c", 5))]
+
+    # Merging freed a slot
+    assert client.send(operation(2))
+    assert queued(client)[-1] == operation(2)
+    assert client._close_code is None
+
+
+def test_drop_cursor_disconnects_when_nothing_can_merge():
+    client = ClientConnection(None, "room", "ot", queue_size=2, overflow_policy="drop_cursor")
+    client.send(operation(1))
+    client.send(cursors(("a", 1)))
+
+    assert not client.send(operation(2))
+    assert client._close_code is not None
+
+
+def test_drop_cursor_drops_a_cursor_update_to_a_queue_full_of_edits():
+    client = ClientConnection(None, "room", "ot", queue_size=2, overflow_policy="drop_cursor")
+    client.send(operation(1))
+    client.send(operation(2))
+
+    assert client.send(cursors(("a", 1)))
+    assert queued(client) == [operation(1), operation(2)]
+    assert client.dropped == 1
+    assert client._close_code is None
+
+
+def test_collapse_shares_one_snapshot_frame_per_version():
+    document = RoomDocument(code="x = 1\n")
+    document_store.documents["collapse"] = document
+    try:
+        first = ClientConnection(None, "collapse", "ot", queue_size=2, overflow_policy="collapse")
+        second = ClientConnection(None, "collapse", "ot", queue_size=2, overflow_policy="collapse")
+        for client in (first, second):
+            client.send(operation(1))
+            client.send(cursors(("a", 1)))
+            client.send(operation(2))
+
+        assert first.queue[-1] is second.queue[-1] is build_snapshot_frame("collapse", "ot")
+        assert queued(first) == [cursors(("a", 1)), {
+            "type": "snapshot", "code": "x = 1\n", "language": "python", "version": 0
+        }]
+
+        document.replace("x = 2\n")
+        assert build_snapshot_frame("collapse", "ot").message["code"] == "x = 2\n"
+    finally:
+        document_store.documents.pop("collapse", None)
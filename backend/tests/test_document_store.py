@@ -0,0 +1,48 @@
+"""
+Write-behind document store: flushing and idle eviction
+"""
+import pytest
+from app.services.document_store import DocumentStore
+from app.services.room_service import RoomService
+
+pytestmark = pytest.mark.anyio
+
+
+async def idle_dirty_store(db):
+    """A store holding one edited room that has been idle for a long time"""
+    room = await RoomService.create_room(db)
+    store = DocumentStore(idle_ttl=1)
+    document = await store.acquire(db, room.id)
+    await store.release(room.id)
+    # Edited through the backplane while idle
+    document.apply_operation(0, [{"type": "insert", "position": 0, "text": "x"}])
+    store.mark_dirty(room.id)
+    store.idle_since[room.id] = 0
+    return store, room.id
+
+
+async def test_evict_idle_saves_and_unloads(db):
+    store, room_id = await idle_dirty_store(db)
+
+    assert await store.evict_idle(now=100) == 1
+    assert store.get(room_id) is None
+    snapshot = await RoomService.get_room_snapshot(db, room_id, cached=False)
+    assert snapshot.version == 1
+
+
+async def test_evict_idle_keeps_a_room_reacquired_during_its_flush(db):
+    store, room_id = await idle_dirty_store(db)
+    document = store.get(room_id)
+    write = store._write
+
+    async def write_then_reacquire(pending):
+        written = await write(pending)
+        # A client reconnects while the flush is being committed
+        assert await store.acquire(db, room_id) is document
+        return written
+
+    store._write = write_then_reacquire
+    assert await store.evict_idle(now=100) == 0
+    assert store.get(room_id) is document
+    assert store.holders[room_id] == 1
+    assert room_id not in store.idle_since
@@ -0,0 +1,156 @@
+"""
+Convergence tests for operation transformation and RoomDocument
+"""
+import random
+from collections import deque
+import pytest
+from app.services.ot_service import OperationError, OTService, RoomDocument
+
+
+def random_ops(rng: random.Random, code: str, count: int):
+    """Valid operations against `code`, each made after the previous one"""
+    ops = []
+    for _ in range(count):
+        if code and rng.random() < 0.4:
+            position = rng.randrange(len(code))
+            length = rng.randint(1, min(4, len(code) - position))
+            op = {"type": "delete", "position": position, "length": length}
+        else:
+            position = rng.randint(0, len(code))
+            op = {"type": "insert", "position": position, "text": rng.choice(["a", "bc", "xyz", "\n"])}
+        code = OTService.apply(code, [op])
+        ops.append(op)
+    return ops
+
+
+def test_apply():
+    code = OTService.apply("hello", [
+        {"type": "insert", "position": 5, "text": " world"},
+        {"type": "delete", "position": 0, "length": 1}
+    ])
+    assert code == "ello world"
+
+
+def test_apply_out_of_range():
+    with pytest.raises(OperationError):
+        OTService.apply("ab", [{"type": "insert", "position": 3, "text": "x"}])
+    with pytest.raises(OperationError):
+        OTService.apply("ab", [{"type": "delete", "position": 1, "length": 2}])
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_transform_converges(seed):
+    rng = random.Random(seed)
+    code = "".join(rng.choice("abc\n") for _ in range(rng.randint(0, 12)))
+    a = random_ops(rng, code, rng.randint(1, 3))
+    b = random_ops(rng, code, rng.randint(1, 3))
+
+    # b applied first on the server: a is transformed with b winning ties
+    a_after_b, b_after_a = OTService._transform_lists(a, b)
+    assert OTService.transform(a, b) == a_after_b
+    assert OTService.apply(OTService.apply(code, b), a_after_b) == OTService.apply(OTService.apply(code, a), b_after_a)
+
+
+def test_concurrent_operations_from_different_authors():
+    document = RoomDocument(code="xyz")
+    document.apply_operation(0, [{"type": "insert", "position": 0, "text": "a"}], author="one")
+    document.apply_operation(0, [{"type": "insert", "position": 3, "text": "b"}], author="two")
+    assert document.code == "axyzb"
+    assert document.version == 2
+
+
+@pytest.mark.parametrize("code", ["", "xyz"])
+def test_second_operation_before_ack_is_rejected(code):
+    document = RoomDocument(code=code)
+    document.apply_operation(0, [{"type": "insert", "position": 0, "text": "a"}], author="one")
+
+    # Made on top of the first operation but before its ack arrived
+    with pytest.raises(OperationError, match="one operation at a time"):
+        document.apply_operation(0, [{"type": "insert", "position": 1, "text": "b"}], author="one")
+
+    # After the ack, the same edit applies as intended
+    document.apply_operation(1, [{"type": "insert", "position": 1, "text": "b"}], author="one")
+    assert document.code == "ab" + code
+
+
+def test_forgotten_authors_are_still_rejected_as_too_old():
+    document = RoomDocument()
+    document.history.limit = 4
+    for index in range(10):
+        document.apply_operation(index, [{"type": "insert", "position": 0, "text": "a"}], author=f"author{index}")
+
+    assert len(document.author_versions) <= len(document.history)
+    with pytest.raises(OperationError):
+        document.apply_operation(0, [{"type": "insert", "position": 0, "text": "b"}], author="author0")
+
+
+class SimulatedClient:
+    """A client keeping one operation in flight and rebasing it on incoming edits"""
+
+    def __init__(self, name: str, code: str, version: int):
+        self.name = name
+        self.code = code
+        self.version = version
+        self.pending = None
+        self.inbox = deque()
+
+    def edit(self, rng: random.Random):
+        """Make an edit and return the message to send, if none is in flight"""
+        if self.pending is not None:
+            return None
+        ops = random_ops(rng, self.code, rng.randint(1, 2))
+        self.code = OTService.apply(self.code, ops)
+        self.pending = ops
+        return (self.name, self.version, ops)
+
+    def receive(self):
+        """Handle the next message from the server"""
+        kind, version, ops = self.inbox.popleft()
+        if kind == "ack":
+            self.pending = None
+        else:
+            if self.pending is not None:
+                # The server applied `ops` first, so it wins ties
+                self.pending, ops = OTService._transform_lists(self.pending, ops)
+            self.code = OTService.apply(self.code, ops)
+        self.version = version
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_clients_converge(seed):
+    rng = random.Random(seed)
+    document = RoomDocument(code="def main():\n    pass\n")
+    clients = [SimulatedClient(f"c{index}", document.code, 0) for index in range(3)]
+    outbox = deque()
+
+    for _ in range(300):
+        action = rng.random()
+        if action < 0.3:
+            message = rng.choice(clients).edit(rng)
+            if message is not None:
+                outbox.append(message)
+        elif action < 0.6 and outbox:
+            # The server handles messages in arrival order
+            name, version, ops = outbox.popleft()
+            applied = document.apply_operation(version, OTService.validate(ops), author=name)
+            for client in clients:
+                if client.name == name:
+                    client.inbox.append(("ack", document.version, None))
+                else:
+                    client.inbox.append(("operation", document.version, applied))
+        else:
+            waiting = [client for client in clients if client.inbox]
+            if waiting:
+                rng.choice(waiting).receive()
+
+    # Deliver everything still in flight
+    while outbox:
+        name, version, ops = outbox.popleft()
+        applied = document.apply_operation(version, OTService.validate(ops), author=name)
+        for client in clients:
+            client.inbox.append(("ack", document.version, None) if client.name == name else ("operation", document.version, applied))
+    for client in clients:
+        while client.inbox:
+            client.receive()
+        assert client.code == document.code
+        assert client.version == document.version
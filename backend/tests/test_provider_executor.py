@@ -0,0 +1,96 @@
+"""
+Provider executor: admission control and releasing slots
+"""
+import asyncio
+import threading
+import pytest
+from app.services.provider_executor import ProviderExecutor
+
+pytestmark = pytest.mark.anyio
+
+
+def blocking(started: threading.Event, finish: threading.Event, value: str) -> str:
+    """A provider call that runs until the test lets it finish"""
+    started.set()
+    finish.wait(5)
+    return value
+
+
+async def wait_for_event(event: threading.Event):
+    """Wait for a worker thread without blocking the event loop"""
+    for _ in range(500):
+        if event.is_set():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("worker did not start")
+
+
+async def drain(executor: ProviderExecutor):
+    """Let the loop run the release callbacks of finished calls"""
+    for _ in range(500):
+        if executor.pending == 0:
+            return
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def executor():
+    executor = ProviderExecutor(kind="thread", workers=1, max_pending=1)
+    yield executor
+    executor.shutdown()
+
+
+async def test_work_past_max_pending_is_rejected_until_the_worker_finishes(executor):
+    started, finish = threading.Event(), threading.Event()
+    running = asyncio.ensure_future(executor.submit(blocking, started, finish, "first"))
+    await wait_for_event(started)
+
+    assert await executor.submit(blocking, started, finish, "second") is None
+    assert executor.stats()["rejected"] == 1
+    assert executor.stats()["pending"] == 1
+
+    finish.set()
+    assert await running == "first"
+    await drain(executor)
+    assert executor.stats()["pending"] == 0
+    assert await executor.submit(str.upper, "third") == "THIRD"
+    assert executor.stats()["completed"] == 2
+
+
+async def test_abandoned_call_keeps_its_slot_while_it_runs(executor):
+    started, finish = threading.Event(), threading.Event()
+    caller = asyncio.ensure_future(executor.submit(blocking, started, finish, "abandoned"))
+    await wait_for_event(started)
+
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    # The worker is still busy with it
+    assert await executor.submit(str.upper, "next") is None
+
+    finish.set()
+    await drain(executor)
+    assert executor.stats()["pending"] == 0
+    assert await executor.submit(str.upper, "next") == "NEXT"
+
+
+async def test_process_pool_runs_picklable_calls():
+    executor = ProviderExecutor(kind="process", workers=1, max_pending=2)
+    try:
+        assert await executor.submit(sum, [1, 2, 3]) == 6
+        await drain(executor)
+        assert executor.stats()["pending"] == 0
+    finally:
+        executor.shutdown()
+
+
+async def test_inline_calls_run_on_the_loop():
+    executor = ProviderExecutor(kind="inline", max_pending=1)
+    assert await executor.submit(str.upper, "a") == "A"
+    assert await executor.submit(str.upper, "b") == "B"
+    assert executor.stats()["rejected"] == 0
+
+
+def test_unknown_kind_is_rejected():
+    with pytest.raises(ValueError):
+        ProviderExecutor(kind="gpu")
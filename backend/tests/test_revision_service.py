@@ -0,0 +1,143 @@
+"""
+Delta-encoded revision storage: saving, rebuilding and concurrent saves
+"""
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+from app.models import CodeRevision, CodeState
+from app.routers.rooms import get_room_revision
+from app.services import revision_service
+from app.services.ot_service import RoomDocument
+from app.services.revision_service import CHECKPOINT, DELTA, RevisionService
+from app.services.room_service import DocumentUpdate, RoomService
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_document(db):
+    """A new room and its live document"""
+    room = await RoomService.create_room(db)
+    snapshot = await RoomService.get_room_snapshot(db, room.id, cached=False)
+    return room.id, RoomDocument(snapshot.code, snapshot.language, snapshot.version, snapshot.epoch)
+
+
+def edit(document: RoomDocument, text: str):
+    """Append `text` to the document as a new version"""
+    document.apply_operation(document.version, [{"type": "insert", "position": len(document.code), "text": text}])
+
+
+async def save(db, room_id: str, document: RoomDocument, changes="log") -> int:
+    """Save the document as the document store does"""
+    if changes == "log":
+        changes = document.history.since(document.saved_version, document.version)
+    update = DocumentUpdate(document.code, document.language, document.version, document.epoch, changes)
+    written = await RoomService.save_code_states(db, {room_id: update})
+    document.saved_version = document.version
+    return written
+
+
+async def revision_kinds(db, room_id: str):
+    result = await db.execute(
+        select(CodeRevision.kind, CodeRevision.version)
+        .where(CodeRevision.room_id == room_id)
+        .order_by(CodeRevision.version, CodeRevision.kind)
+    )
+    return [tuple(row) for row in result.all()]
+
+
+async def test_round_trip_across_checkpoints(db, monkeypatch):
+    monkeypatch.setattr(revision_service, "REVISION_CHECKPOINT_INTERVAL", 5)
+    room_id, document = await create_document(db)
+    texts = {0: document.code}
+
+    for batch in range(6):
+        for _ in range(batch % 3 + 1):
+            edit(document, f"line {document.version}\n")
+            texts[document.version] = document.code
+        assert await save(db, room_id, document) == 1
+
+    kinds = await revision_kinds(db, room_id)
+    assert [version for kind, version in kinds if kind == CHECKPOINT] == [0, 6, 12]
+    assert all(kind == DELTA for kind, version in kinds if version not in (0, 6, 12))
+
+    snapshot = await RoomService.get_room_snapshot(db, room_id, cached=False)
+    assert (snapshot.code, snapshot.version) == (document.code, document.version)
+
+    # Every version, including those between checkpoints, can be rebuilt
+    for version, text in texts.items():
+        assert await RevisionService.get_revision(db, room_id, version) == text
+
+
+async def test_unknown_revision_is_not_found(db):
+    room_id, document = await create_document(db)
+    edit(document, "x")
+    await save(db, room_id, document)
+
+    assert await RevisionService.get_revision(db, room_id, 5) is None
+    with pytest.raises(HTTPException) as error:
+        await get_room_revision(room_id, 5, db)
+    assert error.value.status_code == 404
+
+    found = await get_room_revision(room_id, 1, db)
+    assert found["code"] == document.code
+    with pytest.raises(HTTPException) as error:
+        await get_room_revision("missing", 0, db)
+    assert error.value.status_code == 404
+
+
+async def test_missing_edits_fall_back_to_a_checkpoint(db):
+    room_id, document = await create_document(db)
+    edit(document, "a")
+    await save(db, room_id, document)
+    first = document.code
+
+    # Versions 2 and 3 compacted out of the edit log before the save
+    edit(document, "b")
+    edit(document, "c")
+    await save(db, room_id, document, changes=None)
+
+    assert (CHECKPOINT, 3) in await revision_kinds(db, room_id)
+    assert await RevisionService.get_revision(db, room_id, 1) == first
+    assert await RevisionService.get_revision(db, room_id, 2) is None
+    assert await RevisionService.get_revision(db, room_id, 3) == document.code
+
+    # Deltas resume from the checkpoint
+    edit(document, "d")
+    await save(db, room_id, document)
+    assert await RevisionService.get_revision(db, room_id, 4) == document.code
+    snapshot = await RoomService.get_room_snapshot(db, room_id, cached=False)
+    assert (snapshot.code, snapshot.version) == (document.code, 4)
+
+
+async def test_concurrent_save_of_the_same_version_is_retried(db, monkeypatch):
+    room_id, document = await create_document(db)
+    other = RoomDocument(document.code, document.language, document.version, document.epoch)
+    edit(document, "mine")
+    edit(other, "theirs")
+
+    # This session still holds the code state as it was before the other save
+    result = await db.execute(select(CodeState).where(CodeState.room_id == room_id))
+    stale = result.scalars().first()
+    assert stale.version == 0
+    await db.commit()
+
+    save_once = RoomService._save_code_states
+    attempts = []
+
+    async def interleaved(session, updates):
+        if session is db:
+            attempts.append(session)
+            if len(attempts) == 1:
+                # Another process saves version 1 while this one is saving
+                async with type(db)(bind=db.bind, expire_on_commit=False) as other_db:
+                    await save(other_db, room_id, other)
+        return await save_once(session, updates)
+
+    monkeypatch.setattr(RoomService, "_save_code_states", interleaved)
+    assert await save(db, room_id, document) == 0
+    # The first attempt conflicted; the retry re-read the stored version
+    assert len(attempts) == 2
+
+    # The other process's version was kept, once
+    assert await revision_kinds(db, room_id) == [(CHECKPOINT, 0), (DELTA, 1)]
+    assert await RevisionService.get_revision(db, room_id, 1) == other.code
@@ -0,0 +1,80 @@
+"""
+Archiving cold rooms and restoring them with their history
+"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select, update
+from sqlalchemy.sql import Delete
+from app.models import ArchivedRoom, CodeState, Room
+from app.services.ot_service import RoomDocument
+from app.services.revision_service import RevisionService
+from app.services.room_archive import RoomArchiveService
+from app.services.room_service import DocumentUpdate, RoomService
+
+pytestmark = pytest.mark.anyio
+
+
+async def create_room_with_history(db, edits: int = 3):
+    """A stored room with a few saved versions; returns its id and texts by version"""
+    room = await RoomService.create_room(db)
+    snapshot = await RoomService.get_room_snapshot(db, room.id, cached=False)
+    document = RoomDocument(snapshot.code, snapshot.language, snapshot.version, snapshot.epoch)
+    texts = {0: document.code}
+
+    for index in range(edits):
+        saved = document.version
+        document.apply_operation(document.version, [{"type": "insert", "position": 0, "text": f"{index}"}])
+        texts[document.version] = document.code
+        await RoomService.save_code_states(db, {room.id: DocumentUpdate(
+            document.code, document.language, document.version, document.epoch,
+            document.history.since(saved, document.version)
+        )})
+    return room.id, texts
+
+
+async def test_archive_and_restore_keep_code_and_history(db):
+    room_id, texts = await create_room_with_history(db)
+
+    assert await RoomArchiveService.archive_rooms(db, datetime.utcnow() + timedelta(minutes=1), 10) == 1
+    assert await db.get(ArchivedRoom, room_id) is not None
+    assert (await db.execute(select(Room).where(Room.id == room_id))).first() is None
+
+    # Opening the room restores it
+    snapshot = await RoomService.get_room_snapshot(db, room_id, cached=False)
+    assert (snapshot.code, snapshot.version) == (texts[3], 3)
+    assert await db.get(ArchivedRoom, room_id) is None
+    for version, text in texts.items():
+        assert await RevisionService.get_revision(db, room_id, version) == text
+
+
+async def test_room_saved_while_archiving_is_kept(db, monkeypatch):
+    room_id, texts = await create_room_with_history(db)
+    before = datetime.utcnow() + timedelta(minutes=1)
+    execute = db.execute
+
+    async def save_before_delete(statement, *args, **kwargs):
+        if isinstance(statement, Delete) and statement.table.name == "code_states":
+            # Another process saves the room after it was read for archiving
+            await execute(
+                update(CodeState)
+                .where(CodeState.room_id == room_id)
+                .values(updated_at=before + timedelta(minutes=1))
+            )
+        return await execute(statement, *args, **kwargs)
+
+    monkeypatch.setattr(db, "execute", save_before_delete)
+    assert await RoomArchiveService.archive_rooms(db, before, 10) == 0
+    monkeypatch.undo()
+
+    assert await db.get(ArchivedRoom, room_id) is None
+    snapshot = await RoomService.get_room_snapshot(db, room_id, cached=False)
+    assert (snapshot.code, snapshot.version) == (texts[3], 3)
+    assert await RevisionService.get_revision(db, room_id, 1) == texts[1]
+
+
+async def test_loaded_rooms_are_not_archived(db):
+    room_id, _ = await create_room_with_history(db, edits=1)
+    before = datetime.utcnow() + timedelta(minutes=1)
+
+    assert await RoomArchiveService.archive_rooms(db, before, 10, exclude={room_id}) == 0
+    assert await db.get(ArchivedRoom, room_id) is None
@@ -0,0 +1,131 @@
+"""
+Incremental symbol index: parity with a full build, the size cap, and
+building large indexes in the provider executor
+"""
+import random
+import pytest
+from app.services.autocomplete_service import AutocompleteService
+from app.services.provider_executor import provider_executor
+from app.services.symbol_index import MAX_INLINE_RESCAN_LINES, SymbolIndex
+
+LINES = [
+    "def compute(value, factor=2):",
+    "    return value * factor",
+    "async def fetch(self, url: str):",
+    "class Parser:",
+    "import os, sys",
+    "from collections import OrderedDict",
+    "import numpy as np",
+    "total = 0",
+    "count: int = 1",
+    "for item in items:",
+    "const handler = () => {}",
+    "function render(props, state) {",
+    "x == y",
+    "print(total)",
+    "",
+]
+
+
+def state(index: SymbolIndex):
+    """Indexed names and the count of each definition"""
+    return index._names, {name: dict(variants) for name, variants in index._by_name.items()}
+
+
+def random_edit(rng: random.Random, code: str) -> str:
+    """Insert, delete or replace a random span, often across lines or identifiers"""
+    position = rng.randint(0, len(code))
+    action = rng.random()
+    if action < 0.4:
+        text = rng.choice([
+            rng.choice(LINES) + "\n",
+            "\n".join(rng.sample(LINES, 3)) + "\n",
+            rng.choice(["a", "_x", " ", "(", "=", "\n", "def ", "class "]),
+        ])
+        return code[:position] + text + code[position:]
+    end = min(len(code), position + rng.randint(1, 30))
+    replacement = rng.choice(["", "", "y", "\n", "def f(a):\n"]) if action < 0.8 else code[position:end].upper()
+    return code[:position] + replacement + code[end:]
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_updates_match_a_full_build(seed):
+    rng = random.Random(seed)
+    code = "\n".join(rng.choice(LINES) for _ in range(rng.randint(0, 30)))
+    index = SymbolIndex.build(code)
+
+    for _ in range(60):
+        code = random_edit(rng, code)
+        index.update(code)
+        assert state(index) == state(SymbolIndex.build(code))
+        assert len(index._line_symbols) == code.count("\n") + 1
+
+
+def test_shared_definitions_are_reference_counted():
+    index = SymbolIndex.build("total = 0\ntotal = 1\n")
+    index.update("total = 1\n")
+    assert index.get("total") is not None
+    index.update("")
+    assert index.get("total") is None
+    assert index.stats()["names"] == 0
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_symbol_cap_is_respected(seed):
+    rng = random.Random(seed)
+    code = ""
+    index = SymbolIndex(max_symbols=4)
+    for _ in range(80):
+        code = random_edit(rng, code)
+        index.update(code)
+        assert len(index._names) <= 4
+        assert all(count > 0 for variants in index._by_name.values() for count in variants.values())
+
+
+def test_names_past_the_cap_are_skipped_until_room_is_made():
+    index = SymbolIndex.build("a = 1\nb = 2\nc = 3\n", max_symbols=2)
+    assert index._names == ["a", "b"]
+    assert index.skipped == 1
+
+    index.update("b = 2\nc = 3\n")
+    index.update("b = 2\nc = 3\nd = 4\n")
+    assert index._names == ["b", "d"]
+
+
+@pytest.mark.anyio
+async def test_large_rescans_are_built_in_the_executor(monkeypatch):
+    code = "\n".join(f"name_{line} = {line}" for line in range(MAX_INLINE_RESCAN_LINES * 2))
+    submitted = []
+    submit = provider_executor.submit
+
+    async def recording_submit(func, *args):
+        submitted.append(func)
+        return await submit(func, *args)
+
+    monkeypatch.setattr(provider_executor, "kind", "thread")
+    monkeypatch.setattr(provider_executor, "submit", recording_submit)
+
+    symbols = SymbolIndex()
+    assert await AutocompleteService._update_index(symbols, code)
+    assert submitted == [SymbolIndex.build]
+    assert state(symbols) == state(SymbolIndex.build(code))
+
+    # Small edits after that are indexed in place
+    code += "\nextra = 1"
+    assert await AutocompleteService._update_index(symbols, code)
+    assert submitted == [SymbolIndex.build]
+    assert symbols.get("extra") is not None
+
+
+@pytest.mark.anyio
+async def test_busy_executor_leaves_the_index_unbuilt(monkeypatch):
+    async def busy(func, *args):
+        return None
+
+    monkeypatch.setattr(provider_executor, "kind", "thread")
+    monkeypatch.setattr(provider_executor, "submit", busy)
+
+    symbols = SymbolIndex()
+    code = "\n".join(f"name_{line} = {line}" for line in range(MAX_INLINE_RESCAN_LINES * 2))
+    assert not await AutocompleteService._update_index(symbols, code)
+    assert symbols.stats()["names"] == 0
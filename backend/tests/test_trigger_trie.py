@@ -0,0 +1,80 @@
+"""
+Trigger trie: parity with a linear scan of the suggestion tables
+"""
+import random
+from typing import Dict, Optional, Tuple
+import pytest
+from app.services.autocomplete_service import AutocompleteService, TriggerTrie
+
+TABLES = {
+    "python": AutocompleteService.PYTHON_SUGGESTIONS,
+    "javascript": AutocompleteService.JAVASCRIPT_SUGGESTIONS,
+    # A trigger listed before the triggers that are suffixes of it, and after
+    "suffixes": {
+        "async def ": "async",
+        "def ": "def",
+        "f ": "f",
+        "ef": "ef",
+        "x.y": "x.y",
+        "y": "y",
+        "z": "z",
+        "zz": "zz",
+        "a zz": "a zz",
+    },
+}
+
+
+def linear_match(suggestions: Dict[str, str], line: str) -> Optional[Tuple[str, str]]:
+    """The original scan: the first trigger in table order the line ends with"""
+    for trigger, suggestion in suggestions.items():
+        if line.strip().endswith(trigger.strip()):
+            return trigger.strip(), suggestion
+    return None
+
+
+def lines_for(suggestions: Dict[str, str], rng: random.Random):
+    """Lines ending with each trigger, parts of triggers, and runs of trigger pieces"""
+    triggers = list(suggestions)
+    pieces = [trigger.strip() for trigger in triggers] + [" ", "  ", "\t", "x", "(", "async"]
+    for trigger in triggers:
+        key = trigger.strip()
+        yield key
+        yield trigger
+        yield f"    {key}   "
+        yield f"value = {key}"
+        for cut in range(1, len(key)):
+            yield key[cut:]
+            yield key[:cut]
+    for _ in range(300):
+        yield "".join(rng.choice(pieces) for _ in range(rng.randint(0, 5)))
+
+
+@pytest.mark.parametrize("table", sorted(TABLES))
+def test_trie_matches_the_linear_scan(table):
+    suggestions = TABLES[table]
+    trie = TriggerTrie(suggestions)
+
+    for line in lines_for(suggestions, random.Random(table)):
+        assert trie.match(line) == linear_match(suggestions, line), repr(line)
+
+
+def test_earlier_table_entries_keep_priority():
+    trie = TriggerTrie(TABLES["suffixes"])
+    # "async def" is listed before its suffix "def"
+    assert trie.match("async def") == ("async def", "async")
+    # "zz" is listed after its suffix "z"
+    assert trie.match("a zz") == ("z", "z")
+
+    python = AutocompleteService.PYTHON_TRIGGERS
+    assert python.match("    async def ") == ("def", AutocompleteService.PYTHON_SUGGESTIONS["def "])
+
+
+@pytest.mark.parametrize("language", ["python", "javascript"])
+def test_rules_use_the_first_trigger_in_table_order(language):
+    suggestions = TABLES[language]
+    for trigger in suggestions:
+        line = f"  {trigger}"
+        result = AutocompleteService.match_rules(line, language)
+        expected_trigger, expected = linear_match(suggestions, line)
+        assert result["suggestion"] == expected
+        assert result["description"] == f"Auto-complete for {expected_trigger}"
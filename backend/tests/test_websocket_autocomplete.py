@@ -0,0 +1,58 @@
+"""
+Autocomplete requests over the WebSocket: replies and failures
+"""
+import time
+import pytest
+from app.routers import websocket
+from app.services.autocomplete_service import AutocompleteService
+from app.services.ot_service import RoomDocument
+
+pytestmark = pytest.mark.anyio
+
+
+class Client:
+    """Collects the frames sent to one connection"""
+
+    def __init__(self, client_id: str):
+        self.room_id = "room"
+        self.client_id = client_id
+        self.sent = []
+
+    def send(self, message: dict):
+        self.sent.append(message)
+
+
+async def request(client: Client, document: RoomDocument, **message):
+    await websocket.handle_autocomplete_request(
+        client, document, {"requestId": 7, **message}, time.perf_counter()
+    )
+    return client.sent
+
+
+async def test_request_is_answered_with_a_suggestion():
+    document = RoomDocument("def ", "python", 0)
+    sent = await request(Client("suggested"), document, cursorPosition=4)
+
+    assert [message["type"] for message in sent] == ["autocomplete_response"]
+    assert sent[0]["requestId"] == 7
+    assert sent[0]["suggestion"].startswith("def ")
+
+
+async def test_failing_provider_is_answered_with_an_empty_suggestion(monkeypatch):
+    async def failing(*args):
+        raise RuntimeError("provider crashed")
+
+    monkeypatch.setattr(AutocompleteService, "get_suggestion_async", failing)
+    document = RoomDocument("def ", "python", 0)
+    sent = await request(Client("failed"), document, cursorPosition=4)
+
+    assert len(sent) == 1
+    assert sent[0]["type"] == "autocomplete_response"
+    assert sent[0]["requestId"] == 7
+    assert (sent[0]["suggestion"], sent[0]["confidence"]) == ("", 0.0)
+
+
+async def test_invalid_request_is_answered_with_an_error():
+    document = RoomDocument("def ", "python", 0)
+    sent = await request(Client("invalid"), document, cursorPosition="end")
+    assert sent == [{"type": "error", "message": "invalid autocomplete request"}]
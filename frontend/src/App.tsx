@@ -14,8 +14,10 @@ function App() {
   const { roomId } = useAppSelector((state) => state.room)
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
+  // One id for the roster, edits and cursors
+  const [userId] = useState(() => `user_${Math.random().toString(36).substr(2, 9)}`)
 
-  const { sendMessage } = useWebSocket(roomId)
+  const { sendMessage } = useWebSocket(roomId, userId)
 
   const handleCreateRoom = async () => {
     setIsLoading(true)
@@ -63,7 +65,7 @@ function App() {
       ) : (
         <div className="main-container">
           <div className="editor-container">
-            <CodeEditor sendMessage={sendMessage} />
+            <CodeEditor sendMessage={sendMessage} userId={userId} />
           </div>
           <Sidebar roomId={roomId} />
         </div>
@@ -1,5 +1,5 @@
 import Editor from '@monaco-editor/react'
-import { useEffect, useRef, useState } from 'react'
+import { useEffect, useRef } from 'react'
 import { useAppDispatch, useAppSelector } from '../hooks/useRedux'
 import { roomApi } from '../services/api'
 import type { RootState } from '../store'
@@ -8,14 +8,14 @@ import './CodeEditor.css'
 
 interface CodeEditorProps {
   sendMessage: (message: any) => void
+  userId: string
 }
 
-const CodeEditor = ({ sendMessage }: CodeEditorProps) => {
+const CodeEditor = ({ sendMessage, userId }: CodeEditorProps) => {
   const dispatch = useAppDispatch()
   const editorState = useAppSelector((state: RootState) => state.editor) as any
   const { code, language, autocompleteSuggestion, showSuggestion } = editorState
   // roomId is intentionally not used inside the editor right now
-  const [userId] = useState(() => `user_${Math.random().toString(36).substr(2, 9)}`)
   const autocompleteTimeoutRef = useRef<number>()
   const editorRef = useRef<any>(null)
 
@@ -48,6 +48,7 @@ const CodeEditor = ({ sendMessage }: CodeEditorProps) => {
           code: value,
           cursorPosition: cursorPos,
           language,
+          userId,
         })
 
         if (suggestion.confidence > 0.5) {
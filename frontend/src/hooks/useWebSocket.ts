@@ -2,9 +2,12 @@ import { useCallback, useEffect, useRef } from 'react'
 import type { RootState } from '../store'
 import { setCode } from '../store/slices/editorSlice'
 import {
+    addUser,
+    removeUser,
     resetRoom,
     setConnected,
     setUserCount,
+    setUsers,
 } from '../store/slices/roomSlice'
 import {
     addMessage,
@@ -21,7 +24,7 @@ interface WebSocketMessage {
   [key: string]: any
 }
 
-export const useWebSocket = (roomId: string | null) => {
+export const useWebSocket = (roomId: string | null, userId?: string) => {
   const dispatch = useAppDispatch()
   const wsRef = useRef<WebSocket | null>(null)
   const reconnectTimeoutRef = useRef<number>()
@@ -37,7 +40,9 @@ export const useWebSocket = (roomId: string | null) => {
     }
 
     dispatch(setStatus('connecting'))
-    const ws = new WebSocket(`${WS_BASE_URL}/ws/${roomId}`)
+    // The server names anonymous connections itself and reports it in init
+    const query = userId ? `?userId=${encodeURIComponent(userId)}` : ''
+    const ws = new WebSocket(`${WS_BASE_URL}/ws/${roomId}${query}`)
 
     ws.onopen = () => {
       console.log('WebSocket connected')
@@ -57,6 +62,7 @@ export const useWebSocket = (roomId: string | null) => {
             // Initial state from server
             dispatch(setCode(message.code))
             dispatch(setUserCount(message.connectionCount))
+            dispatch(setUsers(message.users || []))
             dispatch(addMessage({
               type: 'system',
               content: `Room joined. ${message.connectionCount} user(s) online`,
@@ -72,21 +78,28 @@ export const useWebSocket = (roomId: string | null) => {
             }))
             break
 
-          case 'user_joined':
+          case 'presence': {
+            // Joins and leaves batched by the server; may repeat users we
+            // already know from init
+            const joined: string[] = message.joined || []
+            const left: string[] = message.left || []
+            joined.forEach((user) => dispatch(addUser(user)))
+            left.forEach((user) => dispatch(removeUser(user)))
             dispatch(setUserCount(message.connectionCount))
-            dispatch(addMessage({
-              type: 'join',
-              content: `User joined (${message.connectionCount} total)`,
-            }))
-            break
-
-          case 'user_left':
-            dispatch(setUserCount(message.connectionCount))
-            dispatch(addMessage({
-              type: 'leave',
-              content: `User left (${message.connectionCount} remaining)`,
-            }))
+            if (joined.length) {
+              dispatch(addMessage({
+                type: 'join',
+                content: `${joined.length === 1 ? joined[0] : `${joined.length} users`} joined (${message.connectionCount} total)`,
+              }))
+            }
+            if (left.length) {
+              dispatch(addMessage({
+                type: 'leave',
+                content: `${left.length === 1 ? left[0] : `${left.length} users`} left (${message.connectionCount} remaining)`,
+              }))
+            }
             break
+          }
 
           default:
             console.log('Unknown message type:', message.type)
@@ -117,7 +130,7 @@ export const useWebSocket = (roomId: string | null) => {
 
     wsRef.current = ws
     dispatch(setConnection(ws))
-  }, [roomId, dispatch])
+  }, [roomId, userId, dispatch])
 
   const disconnect = useCallback(() => {
     if (reconnectTimeoutRef.current) {
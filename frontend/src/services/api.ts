@@ -16,6 +16,8 @@ export interface AutocompleteRequest {
   code: string
   cursorPosition: number
   language: string
+  userId?: string
+  roomId?: string
 }
 
 export interface AutocompleteResponse {
@@ -24,6 +26,18 @@ export interface AutocompleteResponse {
   description?: string
 }
 
+export interface AutocompleteBatchRequest {
+  code: string
+  cursorPositions: number[]
+  language: string
+  userId?: string
+  roomId?: string
+}
+
+export interface AutocompleteBatchResponse {
+  suggestions: AutocompleteResponse[]
+}
+
 export const roomApi = {
   createRoom: async (): Promise<Room> => {
     const response = await axios.post(`${API_BASE_URL}/api/rooms`)
@@ -39,4 +53,9 @@ export const roomApi = {
     const response = await axios.post(`${API_BASE_URL}/api/autocomplete`, request)
     return response.data
   },
+
+  getAutocompleteBatch: async (request: AutocompleteBatchRequest): Promise<AutocompleteBatchResponse> => {
+    const response = await axios.post(`${API_BASE_URL}/api/autocomplete/batch`, request)
+    return response.data
+  },
 }
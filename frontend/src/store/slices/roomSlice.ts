@@ -29,6 +29,9 @@ const roomSlice = createSlice({
     setUserCount: (state, action: PayloadAction<number>) => {
       state.userCount = action.payload
     },
+    setUsers: (state, action: PayloadAction<string[]>) => {
+      state.users = action.payload
+    },
     addUser: (state, action: PayloadAction<string>) => {
       if (!state.users.includes(action.payload)) {
         state.users.push(action.payload)
@@ -48,6 +51,7 @@ export const {
   setRoomId,
   setConnected,
   setUserCount,
+  setUsers,
   addUser,
   removeUser,
   setCreatedAt,